@@ -3,8 +3,14 @@
 """
 cache-me-outside.py - Search for cached versions of any URL across various services.
 Made by inforensics.ai
+
+The services themselves are defined once in osint_common.archives and
+shared with tweet-cache-search. In bulk mode it reads URLs from a file,
+summarises their Wayback Machine captures through the CDX API and streams
+one JSON line per URL.
 """
 
+import os
 import sys
 import subprocess
 
@@ -21,89 +27,143 @@ def install_requirements():
 install_requirements()
 
 import requests
-from urllib.parse import quote_plus, urlparse
+from urllib.parse import urlparse
 import argparse
 import webbrowser
 import json
-import re
-import time
 
-def safe_request(url):
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from osint_common.archives import CaptureSummary, ProbeEngine, archives_for, wayback_time
+from osint_common.httpcache import shared_cache
+from osint_common.records import dumps
+
+def get_urls_from_file(file_path):
+    """Yield URLs from a file one by one, skipping blank lines and comments."""
+    with open(file_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+def completed_urls(path):
+    """Return the URLs that already have a successful record in a JSONL output file."""
+    done = set()
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and "error" not in record and "url" in record:
+                    done.add(record["url"])
+    except FileNotFoundError:
+        pass
+    return done
+
+def drop_partial_line(path, chunk_size=65536):
+    """Truncate a JSONL file after its last newline, dropping a record cut off by a crash."""
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        return response
-    except requests.RequestException as e:
-        return f"Error accessing {url}: {str(e)}"
-
-def search_wayback_machine(url):
-    wb_url = f"https://web.archive.org/web/*/{url}"
-    result = safe_request(wb_url)
-    if isinstance(result, requests.Response) and result.status_code == 200:
-        return {"service": "Wayback Machine", "status": "success", "url": wb_url}
-    return {"service": "Wayback Machine", "status": "error", "message": str(result)}
-
-def search_google_cache(url):
-    cache_url = f"https://webcache.googleusercontent.com/search?q=cache:{url}"
-    result = safe_request(cache_url)
-    if isinstance(result, requests.Response) and result.status_code == 200:
-        return {"service": "Google Cache", "status": "success", "url": cache_url}
-    return {"service": "Google Cache", "status": "error", "message": str(result)}
-
-def search_bing(url):
-    bing_url = f"https://www.bing.com/search?q=url:{quote_plus(url)}"
-    result = safe_request(bing_url)
-    if isinstance(result, requests.Response) and result.status_code == 200:
-        cache_pattern = r'<a href="(https://cc\.bingj\.com/cache\.aspx[^"]+)"[^>]*>Cached<'
-        match = re.search(cache_pattern, result.text)
-        if match:
-            cache_url = match.group(1)
-            return {"service": "Bing", "status": "success", "url": cache_url, "search_url": bing_url}
-        else:
-            return {"service": "Bing", "status": "success", "url": bing_url, "note": "No cached version link found"}
-    return {"service": "Bing", "status": "error", "message": str(result)}
-
-def search_yandex(url):
-    yandex_url = f"https://yandex.com/search/?text=url:{quote_plus(url)}"
-    result = safe_request(yandex_url)
-    if isinstance(result, requests.Response) and result.status_code == 200:
-        cache_pattern = r'<a href="(https://yandexwebcache\.net[^"]+)"[^>]*>Cached<'
-        match = re.search(cache_pattern, result.text)
-        if match:
-            cache_url = match.group(1)
-            return {"service": "Yandex", "status": "success", "url": cache_url, "search_url": yandex_url}
-        else:
-            return {"service": "Yandex", "status": "success", "url": yandex_url, "note": "No cached version link found"}
-    return {"service": "Yandex", "status": "error", "message": str(result)}
-
-def search_baidu(url):
-    baidu_url = f"https://www.baidu.com/s?wd=url:{quote_plus(url)}"
-    result = safe_request(baidu_url)
-    if isinstance(result, requests.Response) and result.status_code == 200:
-        return {"service": "Baidu", "status": "success", "url": baidu_url}
-    return {"service": "Baidu", "status": "error", "message": str(result)}
-
-def search_internet_archive(url):
-    ia_url = f"https://archive.org/search.php?query={quote_plus(url)}"
-    result = safe_request(ia_url)
-    if isinstance(result, requests.Response) and result.status_code == 200:
-        return {"service": "Internet Archive", "status": "success", "url": ia_url}
-    return {"service": "Internet Archive", "status": "error", "message": str(result)}
-
-def search_archive_today(url):
-    at_url = f"https://archive.today/{url}"
-    result = safe_request(at_url)
-    if isinstance(result, requests.Response) and result.status_code == 200:
-        return {"service": "Archive.today", "status": "success", "url": at_url}
-    return {"service": "Archive.today", "status": "error", "message": str(result)}
+        f = open(path, "r+b")
+    except FileNotFoundError:
+        return
+    with f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - chunk_size)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            f.truncate(position)
+
+def bulk_wayback(engine, urls, output, timestamp=None, max_pages=10, skip=()):
+    """Summarise Wayback captures for every URL and write one JSON line per URL.
+
+    URLs are read lazily and all share the engine's session, with
+    engine.workers requests in flight. Every CDX request goes through the
+    per-host scheduler, so the workers only hide latency and never exceed
+    the Wayback Machine rate limit. Returns the number of URLs with at
+    least one capture.
+    """
+    pending = (url for url in urls if url not in skip)
+
+    def check(url):
+        try:
+            return engine.wayback_captures(url, timestamp=timestamp, max_pages=max_pages)
+        except (requests.RequestException, ValueError) as e:
+            return CaptureSummary(url, error=str(e))
+
+    archived = 0
+    for _, record in engine.scheduler.map(check, pending, key=lambda url: "web.archive.org",
+                                          workers=engine.workers, per_host=engine.workers):
+        if record.captures:
+            archived += 1
+        output.write(dumps(record) + "\n")
+        output.flush()
+    return archived
+
+def print_result(result, open_browser=False):
+    if result.ok:
+        print(f"{result.service} results:")
+        print(f"  URL: {result.url}")
+        if result.search_url:
+            print(f"  Search URL: {result.search_url}")
+        if result.note:
+            print(f"  Note: {result.note}")
+
+        if open_browser:
+            webbrowser.open(result.url)
+    else:
+        print(f"No results found on {result.service}: {result.message}")
+    print("-" * 50)
 
 def main():
     parser = argparse.ArgumentParser(description="Search for cached versions of any URL across various services.")
     parser.add_argument("-u", "--url", help="URL to search for")
     parser.add_argument("-o", "--open", action="store_true", help="Open successful results in default web browser")
     parser.add_argument("-j", "--json", action="store_true", help="Output results in JSON format")
+    parser.add_argument("-b", "--bulk", metavar="FILE", help="File of URLs to check on the Wayback Machine (bulk mode, JSONL output)")
+    parser.add_argument("--output", metavar="FILE", help="Write bulk results to this JSONL file instead of stdout")
+    parser.add_argument("--resume", action="store_true", help="Append to --output and skip URLs it already has results for")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Concurrent CDX requests in bulk mode (default: 4)")
+    parser.add_argument("--timestamp", help="Pick the capture closest to this time, YYYYMMDD[hhmmss] (default: now)")
+    parser.add_argument("--max-pages", type=int, default=10, help="CDX pages of 10000 captures to count per URL in bulk mode (default: 10)")
+    parser.add_argument("--no-http-cache", action="store_true", help="Do not read or write the shared HTTP response cache")
     args = parser.parse_args()
 
+    if args.timestamp:
+        try:
+            wayback_time(args.timestamp)
+        except ValueError:
+            parser.error("--timestamp must look like YYYYMMDD or YYYYMMDDhhmmss")
+
+    http_cache = None if args.no_http_cache else shared_cache()
+
+    if args.bulk:
+        if args.resume and not args.output:
+            parser.error("--resume requires --output")
+        skip = set()
+        if args.resume:
+            drop_partial_line(args.output)
+            skip = completed_urls(args.output)
+        output = open(args.output, "a" if args.resume else "w") if args.output else sys.stdout
+        try:
+            engine = ProbeEngine(workers=args.workers, cache=http_cache)
+            archived = bulk_wayback(engine, get_urls_from_file(args.bulk), output,
+                                    timestamp=args.timestamp, max_pages=args.max_pages, skip=skip)
+        except (IOError, KeyboardInterrupt) as e:
+            sys.exit(f"Bulk check stopped: {e}")
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        print(f"{archived} URLs have Wayback captures", file=sys.stderr)
+        return
+
     if args.url:
         url = args.url
     else:
@@ -113,40 +173,16 @@ def main():
     if not urlparse(url).scheme:
         url = "http://" + url
 
-    services = [
-        search_wayback_machine,
-        search_google_cache,
-        search_bing,
-        search_yandex,
-        search_baidu,
-        search_internet_archive,
-        search_archive_today
-    ]
-
-    results = []
-    for service in services:
-        result = service(url)
-        results.append(result)
+    # Every service is queried at once and results are shown as they arrive
+    archives = archives_for("url")
+    results = {}
+    for result in ProbeEngine(cache=http_cache).run("url", url, archives):
+        results[result.service] = result
         if not args.json:
-            if result["status"] == "success":
-                print(f"{result['service']} results:")
-                print(f"  URL: {result['url']}")
-                if "search_url" in result:
-                    print(f"  Search URL: {result['search_url']}")
-                if "note" in result:
-                    print(f"  Note: {result['note']}")
-                
-                if args.open:
-                    webbrowser.open(result["url"])
-            else:
-                print(f"No results found on {result['service']}: {result['message']}")
-            print("-" * 50)
-        
-        # Add a small delay between requests to be respectful to the services
-        time.sleep(1)
+            print_result(result, args.open)
 
     if args.json:
-        print(json.dumps(results, indent=2))
+        print(dumps([results[archive.name] for archive in archives], indent=True))
 
 if __name__ == "__main__":
     main()
@@ -15,7 +15,6 @@ import whois
 from ipwhois import IPWhois
 import requests
 from requests.exceptions import RequestException
-from bs4 import BeautifulSoup
 import subprocess
 import re
 from tqdm import tqdm
@@ -24,6 +23,11 @@ import geoip2.database
 import OpenSSL
 import idna
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from osint_common import cache_path
+from osint_common.httpcache import create_session, shared_cache
+from osint_common.records import BlobStore, dumps
+
 ASCII_BANNER = '''
 ██╗███╗   ██╗███████╗ ██████╗ ██████╗ ███████╗███╗   ██╗███████╗██╗ ██████╗███████╗
 ██║████╗  ██║██╔════╝██╔═══██╗██╔══██╗██╔════╝████╗  ██║██╔════╝██║██╔════╝██╔════╝
@@ -58,14 +62,28 @@ def load_config(config_path):
 # Global configuration variable
 CONFIG = load_config('config.json')
 
+# Session used by the HTTP analyzers; replaced by a cached session when run
+# as a script. Several analyzers fetch the same homepage, which the cache
+# then downloads only once.
+HTTP = requests
+# Lifetime of HTTP responses that carry no caching headers
+HTTP_TTL = 3600
+
+# Store for large values (robots.txt bodies, zone dumps, long headers);
+# the report then holds a reference to the file instead of the value.
+BLOBS = None
+
+def spill(value):
+    return BLOBS.spill(value) if BLOBS else value
+
 def is_website_live(domain):
     try:
-        response = requests.get(f"http://{domain}", timeout=10)
+        response = HTTP.get(f"http://{domain}", timeout=10)
         response.raise_for_status()
         return True
     except RequestException:
         try:
-            response = requests.get(f"https://{domain}", timeout=10)
+            response = HTTP.get(f"https://{domain}", timeout=10)
             response.raise_for_status()
             return True
         except RequestException:
@@ -140,15 +158,15 @@ def get_ip_info(ip):
 
 def detect_web_technologies(domain):
     try:
-        response = requests.get(f"https://{domain}", timeout=5)
-        soup = BeautifulSoup(response.text, 'html.parser')
+        response = HTTP.get(f"https://{domain}", timeout=5)
+        page = response.text.lower()
         
         technologies = []
-        if 'wordpress' in response.text.lower():
+        if 'wordpress' in page:
             technologies.append('WordPress')
-        if 'joomla' in response.text.lower():
+        if 'joomla' in page:
             technologies.append('Joomla')
-        if 'drupal' in response.text.lower():
+        if 'drupal' in page:
             technologies.append('Drupal')
         
         server = response.headers.get('Server')
@@ -189,8 +207,8 @@ def check_ssl_vulnerabilities(domain):
 
 def analyze_http_headers(domain):
     try:
-        response = requests.get(f"https://{domain}", timeout=5)
-        return dict(response.headers)
+        response = HTTP.get(f"https://{domain}", timeout=5)
+        return {name: spill(value) for name, value in response.headers.items()}
     except Exception as e:
         return f"HTTP Headers Analysis Error: {str(e)}"
 
@@ -287,7 +305,7 @@ def fetch_issuer_cert(cert):
 
 def get_security_headers(domain):
     try:
-        response = requests.get(f"https://{domain}", timeout=5)
+        response = HTTP.get(f"https://{domain}", timeout=5)
         security_headers = {
             'Strict-Transport-Security': response.headers.get('Strict-Transport-Security', 'Not Set'),
             'Content-Security-Policy': response.headers.get('Content-Security-Policy', 'Not Set'),
@@ -303,7 +321,7 @@ def get_security_headers(domain):
 
 def get_web_server_version(domain):
     try:
-        response = requests.get(f"https://{domain}", timeout=5)
+        response = HTTP.get(f"https://{domain}", timeout=5)
         server = response.headers.get('Server', 'Not Disclosed')
         return server
     except Exception as e:
@@ -364,9 +382,9 @@ def check_domain_reputation(domain):
 
 def get_robots_txt(domain):
     try:
-        response = requests.get(f"https://{domain}/robots.txt", timeout=5)
+        response = HTTP.get(f"https://{domain}/robots.txt", timeout=5)
         if response.status_code == 200:
-            return response.text
+            return spill(response.text)
         else:
             return f"No robots.txt found (Status code: {response.status_code})"
     except Exception as e:
@@ -374,7 +392,7 @@ def get_robots_txt(domain):
 
 def get_sitemap(domain):
     try:
-        response = requests.get(f"https://{domain}/sitemap.xml", timeout=5)
+        response = HTTP.get(f"https://{domain}/sitemap.xml", timeout=5)
         if response.status_code == 200:
             return "Sitemap found"
         else:
@@ -400,7 +418,7 @@ def check_dns_propagation(domain):
 
 def check_hsts_preload(domain):
     try:
-        response = requests.get(f"https://hstspreload.org/api/v2/status/{domain}", timeout=5)
+        response = HTTP.get(f"https://hstspreload.org/api/v2/status/{domain}", timeout=5)
         
         if response.status_code == 404:
             return "Domain not found in HSTS preload list"
@@ -453,7 +471,7 @@ def attempt_zone_transfer(domain):
         for ns in nameservers:
             try:
                 z = dns.zone.from_xfr(dns.query.xfr(ns, domain))
-                return {str(name): str(z[name].to_text()) for name in z.nodes.keys()}
+                return spill(z.to_text())
             except Exception as e:
                 pass
         return "Zone transfer not allowed"
@@ -475,7 +493,7 @@ def main(domain, json_output=False, markdown_output=False):
         result["error"] = "Unable to connect to the website. The domain might not be hosted or could be blocking our requests."
         
         if json_output:
-            print(json.dumps(result, indent=2, default=str))
+            print(dumps(result, indent=True))
         elif markdown_output:
             output_path = CONFIG['markdown_output_path'] or os.path.dirname(os.path.abspath(__file__))
             filename = os.path.join(output_path, f"{domain}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md")
@@ -548,7 +566,7 @@ def main(domain, json_output=False, markdown_output=False):
         result['Domain Age'] = "Unable to calculate (WHOIS information not available)"
 
     if json_output:
-        print(json.dumps(result, indent=2, default=str))
+        print(dumps(result, indent=True))
     elif markdown_output:
         output_path = CONFIG['markdown_output_path'] or os.path.dirname(os.path.abspath(__file__))
         filename = os.path.join(output_path, f"{domain}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md")
@@ -559,7 +577,7 @@ def main(domain, json_output=False, markdown_output=False):
             for key, value in result.items():
                 if key not in ['domain', 'query_time']:
                     f.write(f"## {key}\n\n")
-                    f.write(f"```\n{json.dumps(value, indent=2, default=str)}\n```\n\n")
+                    f.write(f"```\n{dumps(value, indent=True)}\n```\n\n")
             
             f.write("\n---\n")
             f.write("Generated by Inforensics Domain Intelligence Tool\n")
@@ -591,7 +609,11 @@ if __name__ == "__main__":
     parser.add_argument("--json", action="store_true", help="Output in JSON format")
     parser.add_argument("--markdown", action="store_true", help="Output in Markdown format")
     parser.add_argument("--config", default="config.json", help="Path to configuration file")
+    parser.add_argument("--no-http-cache", action="store_true", help="Do not read or write the shared HTTP response cache")
+    parser.add_argument("--blob-dir", help="Directory for large values kept out of the report (default: ~/.cache/osint-user-discovery/blobs)")
     args = parser.parse_args()
 
     CONFIG = load_config(args.config)
+    HTTP = create_session(cache=None if args.no_http_cache else shared_cache(), ttl=HTTP_TTL)
+    BLOBS = BlobStore(args.blob_dir or cache_path('blobs'))
     main(args.domain, args.json, args.markdown)
@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+Load Test Script
+Created by inforensics.ai
+
+Benchmarks mastodon-user-search and nostr-user-search without touching the
+public fediverse. Thousands of mock Mastodon instances (HTTPS WebFinger and
+account search endpoints) and mock Nostr relays (websocket REQ/EVENT/EOSE)
+are started on loopback, one port each, in server subprocesses. Their
+latency, error rate and which hosts know a user are configurable. The
+search functions of both scripts then run against them at one or more
+concurrency levels, and searches per second, p50/p99 latency, open sockets
+and peak memory are reported for each level.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import hashlib
+import http
+import json
+import os
+import random
+import resource
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from urllib.parse import parse_qs, urlsplit
+
+import websockets
+from websockets.exceptions import WebSocketException
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from osint_common import load_tool
+from osint_common.ratelimit import HostScheduler
+
+TARGETS = ("mastodon", "nostr")
+PLACEMENTS = ("first", "last", "random", "all")
+
+def raise_fd_limit():
+    """Allow as many open files as the hard limit permits; every mock host needs a socket."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+def holders(name, hosts, placement, hit_ratio):
+    """Return the range of host indices that know name.
+
+    The answer only depends on its arguments, so the mock servers and the
+    harness agree on it without sharing any state.
+    """
+    digest = zlib.crc32(name.encode())
+    if digest % 10000 >= hit_ratio * 10000 or not hosts:
+        return range(0)
+    if placement == "first":
+        return range(0, 1)
+    if placement == "last":
+        return range(hosts - 1, hosts)
+    if placement == "random":
+        index = digest // 10000 % hosts
+        return range(index, index + 1)
+    return range(hosts)
+
+class MockServers:
+    """One shard of mock Mastodon instances and Nostr relays, in one event loop.
+
+    config gives the index ranges this shard serves, the total number of
+    hosts of each kind, and the latency, jitter (seconds), error rate, hit
+    placement and hit ratio shared by all of them.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.rng = random.Random(config["seed"])
+        self.stats = {kind: {"connections": 0, "requests": 0, "errors": 0} for kind in TARGETS}
+
+    async def delay(self):
+        latency, jitter = self.config["latency"], self.config["jitter"]
+        await asyncio.sleep(max(0.0, self.rng.uniform(latency - jitter, latency + jitter)))
+
+    def failing(self):
+        return self.rng.random() < self.config["error_rate"]
+
+    def knows(self, kind, index, name):
+        return index in holders(name, self.config["hosts"][kind], self.config["placement"], self.config["hit_ratio"])
+
+    def mastodon_response(self, index, port, target):
+        """Answer a WebFinger or account search request: (status, body)."""
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        host = f"127.0.0.1:{port}"
+        if url.path == "/.well-known/webfinger":
+            name = query.get("resource", [""])[0].removeprefix("acct:").split("@")[0]
+            if not self.knows("mastodon", index, name):
+                return 404, {"error": "Record not found"}
+            return 200, {"subject": f"acct:{name}@{host}", "aliases": [f"https://{host}/@{name}"],
+                         "links": [{"rel": "http://webfinger.net/rel/profile-page", "type": "text/html",
+                                    "href": f"https://{host}/@{name}"}]}
+        if url.path == "/api/v1/accounts/search":
+            name = query.get("q", [""])[0]
+            if not self.knows("mastodon", index, name):
+                return 200, []
+            return 200, [{"id": str(zlib.crc32(name.encode())), "username": name, "acct": name,
+                          "display_name": f"Mock {name}", "url": f"https://{host}/@{name}"}]
+        return 404, {"error": "Not found"}
+
+    async def mastodon(self, index, reader, writer):
+        """Serve HTTP/1.1 keep-alive requests on one connection to instance index."""
+        stats = self.stats["mastodon"]
+        stats["connections"] += 1
+        port = writer.get_extra_info("sockname")[1]
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                _, target, _ = request_line.decode("latin-1").split(" ", 2)
+                stats["requests"] += 1
+                await self.delay()
+                if self.failing():
+                    stats["errors"] += 1
+                    status, payload = 503, {"error": "Mock failure"}
+                else:
+                    status, payload = self.mastodon_response(index, port, target)
+                body = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+                await writer.drain()
+        except (OSError, ssl.SSLError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def profile_event(self, index, name):
+        pubkey = hashlib.sha256(name.encode()).hexdigest()
+        content = json.dumps({"name": name, "display_name": f"Mock {name}", "nip05": f"{name}@example.com"})
+        return {"id": hashlib.sha256(f"{index}:{name}".encode()).hexdigest(), "pubkey": pubkey,
+                "created_at": 1700000000 + index, "kind": 0, "tags": [], "content": content, "sig": "0" * 128}
+
+    async def subscription(self, index, websocket, sub_id, filters):
+        stats = self.stats["nostr"]
+        stats["requests"] += 1
+        await self.delay()
+        try:
+            if self.failing():
+                # Relays that fail usually drop the connection rather than say why
+                stats["errors"] += 1
+                await websocket.close(1011, "mock failure")
+                return
+            for query in filters:
+                if not isinstance(query, dict) or 0 not in query.get("kinds", [0]):
+                    continue
+                name = query.get("search", "")
+                if self.knows("nostr", index, name):
+                    await websocket.send(json.dumps(["EVENT", sub_id, self.profile_event(index, name)]))
+            await websocket.send(json.dumps(["EOSE", sub_id]))
+        except WebSocketException:
+            # Another subscription's failure already closed the connection
+            pass
+
+    async def relay(self, index, websocket):
+        """Answer each REQ on its own task, so subscriptions on one connection overlap."""
+        self.stats["nostr"]["connections"] += 1
+        tasks = set()
+        try:
+            async for message in websocket:
+                data = json.loads(message)
+                if data[0] == "REQ" and len(data) >= 3:
+                    task = asyncio.create_task(self.subscription(index, websocket, data[1], data[2:]))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        except (WebSocketException, ValueError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def serve(self):
+        """Start every server of the shard, report their ports, then answer commands on stdin.
+
+        A "stats" line prints the cumulative counters as JSON; end of input
+        shuts the shard down.
+        """
+        raise_fd_limit()
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.config["cert"], self.config["key"])
+        servers = []
+        ports = {kind: [] for kind in TARGETS}
+        for index in range(*self.config["ranges"]["mastodon"]):
+            server = await asyncio.start_server(functools.partial(self.mastodon, index), "127.0.0.1", 0,
+                                                ssl=context, backlog=1024)
+            servers.append(server)
+            ports["mastodon"].append(server.sockets[0].getsockname()[1])
+        for index in range(*self.config["ranges"]["nostr"]):
+            server = await websockets.serve(functools.partial(self.relay, index), "127.0.0.1", 0,
+                                            compression=None, backlog=1024)
+            servers.append(server)
+            ports["nostr"].append(next(iter(server.sockets)).getsockname()[1])
+        print(json.dumps(ports), flush=True)
+
+        loop = asyncio.get_running_loop()
+        while True:
+            command = await loop.run_in_executor(None, sys.stdin.readline)
+            if not command:
+                break
+            if command.strip() == "stats":
+                print(json.dumps(self.stats), flush=True)
+        for server in servers:
+            server.close()
+
+class MockFarm:
+    """Mock hosts split evenly across server subprocesses.
+
+    Host i of each kind gets the i-th port returned by start(), so the
+    placement of hits matches the order in which hosts are passed to the
+    search functions.
+    """
+
+    def __init__(self, hosts, processes, options, cert, key):
+        self.hosts = hosts
+        self.processes = []
+        self.shards = []
+        for shard in range(processes):
+            ranges = {kind: (count * shard // processes, count * (shard + 1) // processes)
+                      for kind, count in hosts.items()}
+            self.shards.append(dict(options, hosts=hosts, ranges=ranges, cert=cert, key=key, seed=shard))
+
+    def start(self):
+        ports = {kind: [] for kind in self.hosts}
+        for shard in self.shards:
+            self.processes.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", json.dumps(shard)],
+                                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True))
+        for process in self.processes:
+            line = process.stdout.readline()
+            if not line:
+                raise RuntimeError("a mock server process failed to start")
+            for kind, shard_ports in json.loads(line).items():
+                ports[kind].extend(shard_ports)
+        return ports
+
+    def stats(self):
+        totals = {kind: {"connections": 0, "requests": 0, "errors": 0} for kind in TARGETS}
+        for process in self.processes:
+            process.stdin.write("stats\n")
+            process.stdin.flush()
+            for kind, counters in json.loads(process.stdout.readline()).items():
+                for name, value in counters.items():
+                    totals[kind][name] += value
+        return totals
+
+    def close(self):
+        for process in self.processes:
+            try:
+                process.stdin.close()
+                process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                process.kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class ResourceSampler(threading.Thread):
+    """Record the peak resident memory and open sockets of this process.
+
+    Both are read from /proc every interval seconds. Where /proc is not
+    available, only the lifetime peak RSS from getrusage is known.
+    """
+
+    def __init__(self, interval=0.02):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.peak_rss = 0
+        self.peak_sockets = None
+        self.proc = os.path.isdir("/proc/self/fd")
+
+    def sample(self):
+        if not self.proc:
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak_rss = max(self.peak_rss, rss if sys.platform == "darwin" else rss * 1024)
+            return
+        with open("/proc/self/statm") as statm:
+            self.peak_rss = max(self.peak_rss, int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE"))
+        sockets = 0
+        for fd in os.listdir("/proc/self/fd"):
+            try:
+                sockets += os.readlink(f"/proc/self/fd/{fd}").startswith("socket:")
+            except OSError:
+                pass
+        self.peak_sockets = max(self.peak_sockets or 0, sockets)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.sample()
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+def run_mastodon(mastodon, instances, names, concurrency):
+    """Run search_mastodon_users for every name, concurrency searches at a time."""
+    def search(name):
+        started = time.perf_counter()
+        result = mastodon.search_mastodon_users(name, instances)
+        return time.perf_counter() - started, result is not None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(search, names))
+
+async def run_nostr(nostr, relays, names, concurrency, first_hit, deadline):
+    """Run search_nostr_users for every name over one relay pool, concurrency searches at a time."""
+    limit = asyncio.Semaphore(concurrency)
+    async with nostr.RelayPool() as pool:
+        async def search(name):
+            async with limit:
+                started = time.perf_counter()
+                profiles = await nostr.search_nostr_users(name, relays, pool=pool, first_hit=first_hit, deadline=deadline)
+                return time.perf_counter() - started, bool(profiles)
+
+        return await asyncio.gather(*(search(name) for name in names))
+
+def measure(target, run, names, concurrency, farm, expected):
+    """Run one concurrency level and summarise it."""
+    before = farm.stats()[target]
+    sampler = ResourceSampler()
+    sampler.sample()
+    rss_before = sampler.peak_rss
+    sampler.start()
+    started = time.perf_counter()
+    results = run(names, concurrency)
+    elapsed = time.perf_counter() - started
+    sampler.stop()
+    after = farm.stats()[target]
+    latencies = [latency for latency, _ in results]
+    served = {name: after[name] - before[name] for name in after}
+    return {
+        "target": target,
+        "concurrency": concurrency,
+        "searches": len(names),
+        "elapsed": round(elapsed, 3),
+        "searches_per_second": round(len(names) / elapsed, 2),
+        "requests_per_second": round(served["requests"] / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "found": sum(found for _, found in results),
+        "expected": expected,
+        "requests": served["requests"],
+        "injected_errors": served["errors"],
+        "connections": served["connections"],
+        "peak_sockets": sampler.peak_sockets,
+        "peak_rss_mb": round(sampler.peak_rss / 1024 / 1024, 1),
+        "rss_growth_mb": round((sampler.peak_rss - rss_before) / 1024 / 1024, 1),
+    }
+
+def print_header():
+    print(f"{'target':<9} {'conc':>5} {'search/s':>9} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} "
+          f"{'found':>11} {'conns':>7} {'sockets':>8} {'RSS MB':>8} {'+RSS MB':>8}")
+
+def print_level(level):
+    sockets = "n/a" if level["peak_sockets"] is None else level["peak_sockets"]
+    print(f"{level['target']:<9} {level['concurrency']:>5} {level['searches_per_second']:>9.2f} "
+          f"{level['requests_per_second']:>9.1f} {level['p50_ms']:>9.1f} {level['p99_ms']:>9.1f} "
+          f"{str(level['found']) + '/' + str(level['expected']):>11} {level['connections']:>7} {sockets:>8} "
+          f"{level['peak_rss_mb']:>8.1f} {level['rss_growth_mb']:>8.1f}", flush=True)
+
+def create_certificate(directory):
+    """Create a throwaway self-signed certificate for 127.0.0.1 with openssl."""
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1",
+                    "-nodes", "-keyout", key, "-out", cert, "-days", "1", "-subj", "/CN=127.0.0.1",
+                    "-addext", "subjectAltName=IP:127.0.0.1"], check=True, capture_output=True)
+    return cert, key
+
+def parse_levels(value):
+    try:
+        levels = [int(level) for level in value.split(",") if level.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid concurrency list: {value}")
+    if not levels or min(levels) < 1:
+        raise argparse.ArgumentTypeError("concurrency levels must be positive integers")
+    return levels
+
+def main():
+    description = "Benchmark the Mastodon and Nostr searches against local mock instances and relays."
+    epilog = ("Created by inforensics.ai\n"
+              "Report bugs to jascha@inforensics.ai")
+
+    parser = argparse.ArgumentParser(description=description, epilog=epilog,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-t", "--targets", default=",".join(TARGETS),
+                        help=f"Comma-separated searches to benchmark (default: {','.join(TARGETS)})")
+    parser.add_argument("-m", "--mastodon-hosts", type=int, default=1000, help="Mock Mastodon instances to start (default: 1000)")
+    parser.add_argument("-r", "--relays", type=int, default=1000, help="Mock Nostr relays to start (default: 1000)")
+    parser.add_argument("-n", "--searches", type=int, default=20, help="Usernames to search for at each concurrency level (default: 20)")
+    parser.add_argument("-c", "--concurrency", type=parse_levels, default=[1, 4],
+                        help="Comma-separated numbers of searches to run at once (default: 1,4)")
+    parser.add_argument("--latency", type=float, default=50.0, metavar="MS", help="Mean response latency of the mock hosts in ms (default: 50)")
+    parser.add_argument("--jitter", type=float, default=20.0, metavar="MS", help="Latency varies uniformly by up to this many ms (default: 20)")
+    parser.add_argument("--error-rate", type=float, default=0.0, metavar="FRACTION",
+                        help="Fraction of requests that fail: HTTP 503 on Mastodon, a dropped connection on Nostr (default: 0)")
+    parser.add_argument("--placement", choices=PLACEMENTS, default="random",
+                        help="Which hosts know a user: the first, the last, one at random or all of them (default: random)")
+    parser.add_argument("--hit-ratio", type=float, default=0.5, metavar="FRACTION", help="Fraction of the usernames that exist at all (default: 0.5)")
+    parser.add_argument("-p", "--processes", type=int, default=1, help="Server processes to spread the mock hosts over (default: 1)")
+    parser.add_argument("--real-rate-limits", action="store_true",
+                        help="Keep mastodon-user-search's per-host rate limits (by default they are lifted to measure the client)")
+    parser.add_argument("--first-hit", action="store_true", help="Return Nostr searches at the first profile found")
+    parser.add_argument("--deadline", type=float, default=10.0, metavar="SECONDS", help="Nostr search deadline in seconds (default: 10)")
+    parser.add_argument("-j", "--json", action="store_true", help="Print one JSON line per concurrency level")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        try:
+            asyncio.run(MockServers(json.loads(args.serve)).serve())
+        except KeyboardInterrupt:
+            pass
+        return
+
+    targets = [target.strip() for target in args.targets.split(",") if target.strip()]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown target(s): {', '.join(sorted(unknown))}")
+    hosts = {"mastodon": args.mastodon_hosts if "mastodon" in targets else 0,
+             "nostr": args.relays if "nostr" in targets else 0}
+    fd_limit = raise_fd_limit()
+    log = sys.stderr if args.json else sys.stdout
+
+    print("Load Test Script", file=log)
+    print("Created by inforensics.ai", file=log)
+    print(file=log)
+    if sum(hosts.values()) + 1024 > fd_limit:
+        print(f"Warning: {sum(hosts.values())} mock hosts may exceed the open file limit of {fd_limit}", file=log)
+
+    options = {"latency": args.latency / 1000, "jitter": args.jitter / 1000, "error_rate": args.error_rate,
+               "placement": args.placement, "hit_ratio": args.hit_ratio}
+    names = [f"user{i}" for i in range(args.searches)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            cert, key = create_certificate(directory)
+        except (OSError, subprocess.CalledProcessError) as e:
+            sys.exit(f"Could not create a test certificate with openssl: {e}")
+        # requests verifies the mock instances against this certificate only
+        os.environ["REQUESTS_CA_BUNDLE"] = cert
+
+        with MockFarm(hosts, args.processes, options, cert, key) as farm:
+            started = time.monotonic()
+            ports = farm.start()
+            print(f"Started {hosts['mastodon']} Mastodon instances and {hosts['nostr']} Nostr relays "
+                  f"in {args.processes} process(es) in {time.monotonic() - started:.1f}s", file=log)
+            print(file=log)
+            if not args.json:
+                print_header()
+
+            for target in targets:
+                if target == "mastodon":
+                    mastodon = load_tool("mastodon-user-search")
+                    if not args.real_rate_limits:
+                        mastodon.SCHEDULER = HostScheduler(rate=1e9, burst=1e9, max_retries=mastodon.SCHEDULER.max_retries,
+                                                           backoff=mastodon.SCHEDULER.backoff)
+                    instances = [f"127.0.0.1:{port}" for port in ports["mastodon"]]
+                    run = functools.partial(run_mastodon, mastodon, instances)
+                else:
+                    nostr = load_tool("nostr-user-search")
+                    relays = [f"ws://127.0.0.1:{port}" for port in ports["nostr"]]
+                    run = lambda names, concurrency: asyncio.run(
+                        run_nostr(nostr, relays, names, concurrency, args.first_hit, args.deadline))
+                expected = sum(bool(holders(name, hosts[target], args.placement, args.hit_ratio)) for name in names)
+                for concurrency in args.concurrency:
+                    level = measure(target, run, names, concurrency, farm, expected)
+                    if args.json:
+                        print(json.dumps(level), flush=True)
+                    else:
+                        print_level(level)
+
+if __name__ == "__main__":
+    main()
@@ -6,19 +6,45 @@ Created by inforensics.ai
 This script searches for a Mastodon user across multiple instances.
 It uses the instances.social API to fetch a list of instances to search,
 or allows the user to specify their own list of instances.
+
+In batch mode it reads usernames from a file and checks every
+(username, instance) pair with a WebFinger lookup, falling back to the
+account search API, and streams one JSON line per pair.
 """
 
 import requests
 import concurrent.futures
+import json
 import os
+import sys
+import time
+import sqlite3
 import argparse
+import threading
+from dataclasses import dataclass
+from typing import Optional
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from osint_common import cache_path
+from osint_common.httpcache import create_session, shared_cache
+from osint_common.ratelimit import HostBreaker, HostScheduler, RETRY_STATUSES
+from osint_common.records import dumps
+
 load_dotenv()
 
 INSTANCES_API_KEY = os.getenv('INSTANCES_API_KEY')
 
-def get_instances_from_api(count=100, min_users=1000, include_down=False, include_closed=False):
+# Mastodon allows 300 unauthenticated API calls per 5 minutes per IP; the
+# buckets adapt to the X-RateLimit headers once an instance has answered.
+SCHEDULER = HostScheduler(rate=1.0, burst=5)
+
+# Lifetime of an instances.social list that carries no caching headers.
+# WebFinger and search lookups bypass the HTTP cache: whether a user exists
+# is remembered only by the ResultCache, under its own TTLs.
+INSTANCES_TTL = 86400
+
+def get_instances_from_api(count=100, min_users=1000, include_down=False, include_closed=False, session=None):
     url = "https://instances.social/api/v1/instances/list"
     params = {
         "count": count,
@@ -31,12 +57,12 @@ def get_instances_from_api(count=100, min_users=1000, include_down=False, includ
     headers = {"Authorization": f"Bearer {INSTANCES_API_KEY}"}
     
     try:
-        response = requests.get(url, params=params, headers=headers)
+        response = (session or requests).get(url, params=params, headers=headers)
         response.raise_for_status()
         data = response.json()
         return [instance['name'] for instance in data['instances']]
-    except requests.RequestException as e:
-        print(f"Error fetching instances: {e}")
+    except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+        print(f"Error fetching instances: {e}", file=sys.stderr)
         return []
 
 def get_instances_from_file(file_path):
@@ -44,22 +70,110 @@ def get_instances_from_file(file_path):
         with open(file_path, 'r') as f:
             return [line.strip() for line in f if line.strip()]
     except IOError as e:
-        print(f"Error reading file: {e}")
+        print(f"Error reading file: {e}", file=sys.stderr)
+        return []
+
+def get_usernames_from_file(file_path):
+    try:
+        with open(file_path, 'r') as f:
+            return [line.strip().lstrip('@') for line in f if line.strip()]
+    except IOError as e:
+        print(f"Error reading file: {e}", file=sys.stderr)
         return []
 
-def search_user(instance, username, verbose=False):
+ACCOUNT_FIELDS = ('id', 'username', 'acct', 'display_name', 'url')
+
+def compact_account(account):
+    """Keep only the account fields we report, so cached payloads stay small."""
+    return {field: account.get(field) for field in ACCOUNT_FIELDS if account.get(field) is not None}
+
+class ResultCache:
+    """Local SQLite cache of lookups keyed by (instance, normalized username).
+
+    Positive and negative answers expire after separate TTLs (in seconds).
+    Negative answers are only served when skip_absent is set; otherwise they
+    are kept for reference but the instance is queried again. Only definite
+    answers are stored, never errors.
+    """
+
+    def __init__(self, path, positive_ttl=7 * 86400, negative_ttl=86400, skip_absent=False):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.skip_absent = skip_absent
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS results (
+            instance TEXT NOT NULL,
+            username TEXT NOT NULL,
+            found INTEGER NOT NULL,
+            account TEXT,
+            checked_at REAL NOT NULL,
+            PRIMARY KEY (instance, username)
+        ) WITHOUT ROWID""")
+
+    @staticmethod
+    def key(instance, username):
+        return instance.strip().lower(), username.strip().lstrip('@').lower()
+
+    def get(self, instance, username):
+        """Return (found, account) for a fresh entry that may be served, else None."""
+        with self.lock:
+            row = self.db.execute("SELECT found, account, checked_at FROM results WHERE instance = ? AND username = ?",
+                                  self.key(instance, username)).fetchone()
+        if row is None:
+            return None
+        found, account, checked_at = row
+        age = time.time() - checked_at
+        if found and age < self.positive_ttl:
+            return True, json.loads(account)
+        if not found and self.skip_absent and age < self.negative_ttl:
+            return False, None
+        return None
+
+    def put(self, instance, username, found, account=None):
+        payload = dumps(compact_account(account)) if found else None
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                            (*self.key(instance, username), int(found), payload, time.time()))
+            self.pending += 1
+            if self.pending >= 100:
+                self.db.commit()
+                self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+def search_user(instance, username, verbose=False, session=None, cache=None):
     if verbose:
         print(f"Searching {instance}...")
+    if cache:
+        cached = cache.get(instance, username)
+        if cached:
+            found, account = cached
+            if verbose:
+                print(f"Cached result for {instance}: {'found' if found else 'not found'}")
+            return {'instance': instance, 'account': account} if found else None
+    http = session or requests
     try:
         url = f"https://{instance}/api/v1/accounts/search?q={username}&limit=1"
-        response = requests.get(url, timeout=5)
+        response = SCHEDULER.request(http, 'GET', url, timeout=5)
         if response.status_code == 200:
             results = response.json()
             if results and results[0]['username'].lower() == username.lower():
+                account = compact_account(results[0])
+                if cache:
+                    cache.put(instance, username, True, account)
                 return {
                     'instance': instance,
-                    'account': results[0]
+                    'account': account
                 }
+            if cache:
+                cache.put(instance, username, False)
         if verbose:
             print(f"User not found on {instance}")
     except requests.RequestException as e:
@@ -67,9 +181,175 @@ def search_user(instance, username, verbose=False):
             print(f"Error searching {instance}: {str(e)}")
     return None
 
-def search_mastodon_users(username, instances, verbose=False):
+@dataclass(slots=True)
+class CheckResult:
+    """Outcome of checking one (username, instance) pair; unset fields are not written."""
+    username: str
+    instance: str
+    found: bool = False
+    method: Optional[str] = None
+    url: Optional[str] = None
+    display_name: Optional[str] = None
+    error: Optional[str] = None
+
+class WebFingerUnavailable(Exception):
+    """Raised when an instance does not answer WebFinger lookups usefully."""
+
+def webfinger_lookup(instance, username, session=None):
+    """Resolve acct:username@instance via WebFinger.
+
+    Returns the profile URL when the account exists, None when the instance
+    reports it as unknown, and raises WebFingerUnavailable when the endpoint
+    answers but cannot be used and the caller should fall back to the search
+    API. Transport errors (timeouts, refused connections) are raised as is:
+    the search API on the same host would fail the same way.
+    """
+    http = session or requests
+    url = f"https://{instance}/.well-known/webfinger"
+    params = {"resource": f"acct:{username}@{instance}"}
+    response = SCHEDULER.request(http, 'GET', url, params=params, timeout=5,
+                                 headers={"Accept": "application/jrd+json"})
+    if response.status_code == 404:
+        return None
+    if response.status_code in RETRY_STATUSES:
+        # Rate limited or overloaded: the search API would fail the same way
+        response.raise_for_status()
+    if response.status_code != 200:
+        raise WebFingerUnavailable(f"HTTP {response.status_code}")
+    try:
+        data = response.json()
+    except ValueError:
+        raise WebFingerUnavailable("invalid JSON")
+    if not isinstance(data, dict):
+        raise WebFingerUnavailable("response is not a JRD object")
+    links, aliases = data.get('links', []), data.get('aliases', [])
+    if not isinstance(links, list) or not isinstance(aliases, list):
+        raise WebFingerUnavailable("malformed JRD")
+    for link in links:
+        if isinstance(link, dict) and link.get('rel') == 'http://webfinger.net/rel/profile-page' \
+                and isinstance(link.get('href'), str) and link['href']:
+            return link['href']
+    for alias in aliases:
+        if isinstance(alias, str) and alias.startswith('http'):
+            return alias
+    subject = data.get('subject')
+    return subject if isinstance(subject, str) and subject else f"acct:{username}@{instance}"
+
+def check_user(instance, username, session=None, no_webfinger=None, cache=None, breaker=None):
+    """Check one (username, instance) pair and return a CheckResult.
+
+    Fresh cache entries are served first. Otherwise WebFinger is tried;
+    instances added to the no_webfinger set (those that answered WebFinger
+    with an unusable response) are queried through the account search API
+    directly. With a HostBreaker, instances that keep failing at the
+    transport level are skipped instead of being tried for every username.
+    """
+    record = CheckResult(username, instance)
+    if cache:
+        cached = cache.get(instance, username)
+        if cached:
+            found, account = cached
+            record.method = "cache"
+            if found:
+                record.found = True
+                record.url = account.get('url')
+                record.display_name = account.get('display_name')
+            return record
+    host = instance.lower()
+    if breaker and not breaker.allow(host):
+        record.error = "instance unreachable, skipped"
+        return record
+    if no_webfinger is None or instance not in no_webfinger:
+        try:
+            profile_url = webfinger_lookup(instance, username, session)
+            if breaker:
+                breaker.success(host)
+            record.method = "webfinger"
+            if profile_url:
+                record.found = True
+                record.url = profile_url
+            if cache:
+                cache.put(instance, username, record.found, {"username": username, "url": profile_url})
+            return record
+        except WebFingerUnavailable:
+            if breaker:
+                breaker.success(host)
+            if no_webfinger is not None:
+                no_webfinger.add(instance)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if breaker:
+                breaker.failure(host)
+            record.method = "webfinger"
+            record.error = str(e)
+            return record
+        except requests.RequestException as e:
+            record.method = "webfinger"
+            record.error = str(e)
+            return record
+    record.method = "search"
+    http = session or requests
+    try:
+        url = f"https://{instance}/api/v1/accounts/search"
+        response = SCHEDULER.request(http, 'GET', url, params={"q": username, "limit": 1}, timeout=5)
+        response.raise_for_status()
+        results = response.json()
+        if results and results[0]['username'].lower() == username.lower():
+            record.found = True
+            record.url = results[0].get('url')
+            record.display_name = results[0].get('display_name')
+        if cache:
+            cache.put(instance, username, record.found, results[0] if record.found else None)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        if breaker:
+            breaker.failure(host)
+        record.error = str(e)
+    except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+        record.error = str(e)
+    return record
+
+def batch_search(usernames, instances, output, workers=50, verbose=False, cache=None):
+    """Check every (username, instance) pair and write one JSON line per pair.
+
+    All lookups share a single session and connection pool. Pairs are read
+    lazily and dispatched through the per-host scheduler, so memory stays
+    flat for runs with hundreds of thousands of pairs and a rate-limited
+    instance never holds up the others. Returns the number of pairs where
+    the user was found. Instances that fail to connect twice in a row (each
+    time after the scheduler's own retries) are skipped for five minutes
+    instead of being retried for every username.
+    """
+    session = create_session(pool_size=workers, hosts=len(instances))
+    no_webfinger = set()
+    breaker = HostBreaker(threshold=2)
+    pairs = ((username, instance) for username in usernames for instance in instances)
+    found = 0
+    for _, record in SCHEDULER.map(lambda pair: check_user(pair[1], pair[0], session, no_webfinger, cache, breaker),
+                                   pairs, key=lambda pair: pair[1].lower(), workers=workers):
+        if record.found:
+            found += 1
+        if verbose and record.error:
+            print(f"Error checking {record.username} on {record.instance}: {record.error}", file=sys.stderr)
+        output.write(dumps(record) + "\n")
+        output.flush()
+    return found
+
+def search_mastodon_users(username, instances, verbose=False, cache=None):
+    if cache:
+        # Serve a cached hit without touching the network, and drop instances
+        # where the user was recently confirmed absent (if skip_absent is set)
+        remaining = []
+        for instance in instances:
+            cached = cache.get(instance, username)
+            if cached is None:
+                remaining.append(instance)
+            elif cached[0]:
+                return {'instance': instance, 'account': cached[1]}
+        if verbose and len(remaining) < len(instances):
+            print(f"Skipping {len(instances) - len(remaining)} instances with cached results")
+        instances = remaining
+    session = create_session(pool_size=10, hosts=len(instances))
     with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_instance = {executor.submit(search_user, instance, username, verbose): instance for instance in instances}
+        future_to_instance = {executor.submit(search_user, instance, username, verbose, session, cache): instance for instance in instances}
         for future in concurrent.futures.as_completed(future_to_instance):
             result = future.result()
             if result:
@@ -83,7 +363,7 @@ def main():
 
     parser = argparse.ArgumentParser(description=description, epilog=epilog,
                                      formatter_class=argparse.RawDescriptionHelpFormatter)
-    parser.add_argument("username", help="The Mastodon username to search for")
+    parser.add_argument("username", nargs='?', help="The Mastodon username to search for")
     parser.add_argument("-c", "--count", type=int, default=100, help="Number of instances to search (default: 100)")
     parser.add_argument("-m", "--min-users", type=int, default=1000, help="Minimum number of users an instance should have (default: 1000)")
     parser.add_argument("--include-down", action="store_true", help="Include down instances in the search")
@@ -91,40 +371,89 @@ def main():
     parser.add_argument("-v", "--verbose", action="store_true", help="Enable verbose output")
     parser.add_argument("-i", "--instances", nargs='+', help="List of Mastodon instances to search")
     parser.add_argument("-f", "--file", help="File containing a list of Mastodon instances to search")
+    parser.add_argument("-b", "--batch", help="File containing a list of usernames to check (batch mode, JSONL output)")
+    parser.add_argument("-o", "--output", help="Write batch results to this JSONL file instead of stdout")
+    parser.add_argument("-w", "--workers", type=int, default=50, help="Number of concurrent lookups in batch mode (default: 50)")
+    parser.add_argument("--cache", default=None, help="Result cache file (default: ~/.cache/osint-user-discovery/mastodon-results.sqlite)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the result cache")
+    parser.add_argument("--positive-ttl", type=float, default=168, help="Hours to trust a cached 'found' result (default: 168)")
+    parser.add_argument("--negative-ttl", type=float, default=24, help="Hours to trust a cached 'not found' result (default: 24)")
+    parser.add_argument("--skip-absent", action="store_true", help="Skip instances where the user was confirmed absent within the negative TTL")
+    parser.add_argument("--no-http-cache", action="store_true", help="Do not keep the instances.social list in the shared HTTP response cache")
     
     args = parser.parse_args()
-    
-    print("Mastodon User Search Script")
-    print("Created by inforensics.ai")
-    print()
+
+    if not args.username and not args.batch:
+        parser.error("a username or --batch file is required")
+
+    # Batch results may be streamed to stdout, so keep status messages on stderr
+    log = sys.stderr if args.batch else sys.stdout
+
+    print("Mastodon User Search Script", file=log)
+    print("Created by inforensics.ai", file=log)
+    print(file=log)
 
     if args.verbose:
-        print("Verbose mode enabled")
+        print("Verbose mode enabled", file=log)
     
     if args.instances:
         instances = args.instances
-        print(f"Using {len(instances)} instances provided via command line.")
+        print(f"Using {len(instances)} instances provided via command line.", file=log)
     elif args.file:
         instances = get_instances_from_file(args.file)
-        print(f"Using {len(instances)} instances from file: {args.file}")
+        print(f"Using {len(instances)} instances from file: {args.file}", file=log)
     else:
-        print("Fetching list of instances from API...")
-        instances = get_instances_from_api(count=args.count, min_users=args.min_users, 
-                                           include_down=args.include_down, include_closed=args.include_closed)
+        print("Fetching list of instances from API...", file=log)
+        http_cache = None if args.no_http_cache else shared_cache()
+        try:
+            instances = get_instances_from_api(count=args.count, min_users=args.min_users,
+                                               include_down=args.include_down, include_closed=args.include_closed,
+                                               session=create_session(cache=http_cache, ttl=INSTANCES_TTL))
+        finally:
+            if http_cache:
+                http_cache.close()
     
     if not instances:
-        print("No instances available to search. Please check your input or API key.")
+        print("No instances available to search. Please check your input or API key.", file=log)
+        return
+
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(args.cache or cache_path('mastodon-results.sqlite'),
+                            positive_ttl=args.positive_ttl * 3600, negative_ttl=args.negative_ttl * 3600,
+                            skip_absent=args.skip_absent)
+    try:
+        run_search(args, instances, cache, log)
+    finally:
+        if cache:
+            cache.close()
+
+def run_search(args, instances, cache, log):
+    if args.batch:
+        usernames = get_usernames_from_file(args.batch)
+        if not usernames:
+            print("No usernames available to check. Please check your input.", file=log)
+            return
+        print(f"Checking {len(usernames)} usernames across {len(instances)} instances...", file=log)
+        output = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            found = batch_search(usernames, instances, output, workers=args.workers, verbose=args.verbose,
+                                 cache=cache)
+        finally:
+            if args.output:
+                output.close()
+        print(f"\nFound {found} matches across {len(usernames) * len(instances)} checks.", file=log)
         return
     
     print(f"Searching for user @{args.username} across {len(instances)} instances...")
-    result = search_mastodon_users(args.username, instances, args.verbose)
+    result = search_mastodon_users(args.username, instances, args.verbose, cache)
     
     if result:
         account = result['account']
         print(f"\nUser found on {result['instance']}:")
-        print(f"Username: @{account['username']}")
-        print(f"Display name: {account['display_name']}")
-        print(f"Account URL: {account['url']}")
+        print(f"Username: @{account.get('username', args.username)}")
+        print(f"Display name: {account.get('display_name', 'Unknown')}")
+        print(f"Account URL: {account.get('url')}")
     else:
         print(f"\nUser @{args.username} not found on any of the searched instances.")
 
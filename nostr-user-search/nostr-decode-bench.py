@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Nostr Decode Benchmark
+Created by inforensics.ai
+
+Measures how fast relay messages are turned into kind-0 profiles. It replays
+a stream recorded with `nostr-user-search.py --record FILE` (one raw message
+per line), or a synthetic stream, through the original decoding (json.loads
+on every message and every content field) and through the fast decoding
+layer with each available JSON backend.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nostr-user-search.py")
+# Backend name -> modules to hide so that nostr-user-search.py picks it
+BACKENDS = {
+    "json": ("orjson", "msgspec"),
+    "orjson": (),
+    "msgspec": ("orjson",),
+}
+
+def load_search_module(backend):
+    """Import nostr-user-search.py with the faster JSON backends hidden as needed."""
+    hidden = {name: sys.modules.get(name) for name in BACKENDS[backend]}
+    for name in hidden:
+        sys.modules[name] = None
+    try:
+        spec = importlib.util.spec_from_file_location(f"nostr_user_search_{backend}", SCRIPT)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        for name, previous in hidden.items():
+            if previous is None:
+                del sys.modules[name]
+            else:
+                sys.modules[name] = previous
+    return module if module.JSON_BACKEND == backend else None
+
+def generate_stream(count, metadata_share=0.1, seed=1):
+    """Build a relay stream that looks like a bulk pull: mostly notes, some metadata."""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        pubkey = f"{rng.getrandbits(256):064x}"
+        if rng.random() < metadata_share:
+            content = json.dumps({"name": f"user{i}", "display_name": f"User {i}", "nip05": f"user{i}@example.com",
+                                  "about": "Lorem ipsum dolor sit amet. " * 8, "picture": f"https://example.com/{i}.png"})
+            kind, tags = 0, []
+        else:
+            content = "A note with some text, #tags and a link https://example.com/ " * rng.randint(1, 6)
+            kind = 1
+            tags = [["e", f"{rng.getrandbits(256):064x}"], ["p", f"{rng.getrandbits(256):064x}"], ["t", "nostr"]]
+        event = {"id": f"{rng.getrandbits(256):064x}", "pubkey": pubkey, "created_at": 1700000000 + i,
+                 "kind": kind, "tags": tags, "content": content, "sig": f"{rng.getrandbits(512):0128x}"}
+        lines.append(json.dumps(["EVENT", "bench", event], separators=(",", ":")))
+    lines.append('["EOSE","bench"]')
+    return lines
+
+def baseline(lines):
+    """The original decoding in search_user: two json.loads per kind-0 event."""
+    kept = 0
+    for line in lines:
+        data = json.loads(line)
+        if data[0] == "EVENT" and data[2]["kind"] == 0:
+            content = json.loads(data[2]["content"])
+            profile = {
+                "relay": "bench",
+                "pubkey": data[2]["pubkey"],
+                "name": content.get("name", "Unknown"),
+                "display_name": content.get("display_name", "Unknown"),
+                "nip05": content.get("nip05", "Unknown"),
+            }
+            kept += bool(profile)
+    return kept
+
+def fast(module):
+    def run(lines):
+        kept = 0
+        kinds = {0}
+        for line in lines:
+            data = module.decode_message(line, kinds)
+            if data and data[0] == "EVENT" and module.parse_profile("bench", data[2]):
+                kept += 1
+        return kept
+    return run
+
+def measure(name, decode, lines, repeat):
+    size = sum(len(line) for line in lines)
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        kept = decode(lines)
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:<22} {len(lines) / best:>12,.0f} msg/s {size / best / 1e6:>9.1f} MB/s  ({kept} profiles kept)")
+    return best
+
+def main():
+    description = "Benchmark decoding of Nostr relay messages."
+    epilog = ("Created by inforensics.ai\n"
+              "Report bugs to jascha@inforensics.ai")
+
+    parser = argparse.ArgumentParser(description=description, epilog=epilog,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", nargs="?", help="Recorded relay stream (from nostr-user-search.py --record)")
+    parser.add_argument("-n", "--generate", type=int, default=100000, help="Synthetic messages to generate when no file is given (default: 100000)")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Runs per decoder; the best is reported (default: 3)")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "r") as f:
+            lines = [line.rstrip("\n") for line in f if line.strip()]
+        print(f"Replaying {len(lines)} recorded messages from {args.file}")
+    else:
+        lines = generate_stream(args.generate)
+        print(f"Replaying {len(lines)} synthetic messages")
+    print()
+
+    reference = measure("baseline (json x2)", baseline, lines, args.repeat)
+    for backend in BACKENDS:
+        module = load_search_module(backend)
+        if module is None:
+            print(f"{'fast (' + backend + ')':<22} not installed")
+            continue
+        elapsed = measure(f"fast ({backend})", fast(module), lines, args.repeat)
+        print(f"{'':<22} {reference / elapsed:>12.1f}x baseline")
+
+if __name__ == "__main__":
+    main()
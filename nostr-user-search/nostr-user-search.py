@@ -5,15 +5,44 @@ Created by inforensics.ai
 
 This script searches for a Nostr user across multiple relays.
 It allows users to specify their own list of relays to search.
+
+In batch mode it reads public keys (hex or npub) from a file, packs them
+into multi-author metadata filters and streams the newest profile for each
+key as JSON lines.
 """
 
 import asyncio
 import argparse
+import contextlib
+import itertools
 import json
-from urllib.parse import urlparse
+import os
+import re
+import secrets
+import sqlite3
+import sys
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode, urlparse
 import ssl
 import certifi
 import websockets
+from websockets.exceptions import ConnectionClosedError, WebSocketException
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from osint_common import cache_path
+from osint_common.records import dumps
+
+# Optional fast JSON backends; the standard json module is used without them
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 DEFAULT_RELAYS = [
     "wss://relay.damus.io",
@@ -23,55 +52,912 @@ DEFAULT_RELAYS = [
     "wss://nos.lol",
 ]
 
-async def search_user(relay_url, identifier, verbose=False):
-    if verbose:
-        print(f"Searching {relay_url}...")
-    
-    ssl_context = ssl.create_default_context(cafile=certifi.where())
-    
-    try:
-        async with websockets.connect(relay_url, ssl=ssl_context) as websocket:
-            # Check if the identifier is a public key (hex string) or a NIP-05 identifier
-            if len(identifier) == 64 and all(c in '0123456789abcdef' for c in identifier.lower()):
-                # It's likely a public key
-                query = {
-                    "kinds": [0],  # Metadata event
-                    "authors": [identifier],
-                }
-            else:
-                # Treat it as a NIP-05 identifier
-                query = {
-                    "kinds": [0],  # Metadata event
-                    "search": identifier,
-                }
+RELAY_ERRORS = (WebSocketException, asyncio.TimeoutError, OSError)
+
+EVENT_PREFIX = '["EVENT"'
+# Quotes inside JSON string values are escaped, so an unescaped "kind": can
+# only be the event's own key and is safe to read before parsing
+KIND_PATTERN = re.compile(r'"kind"\s*:\s*(\d+)')
+METADATA_FIELDS = ("name", "display_name", "nip05")
+
+if orjson is not None:
+    JSON_BACKEND = "orjson"
+    _loads = orjson.loads
+elif msgspec is not None:
+    JSON_BACKEND = "msgspec"
+
+    class _Event(msgspec.Struct):
+        pubkey: str
+        kind: int
+        created_at: int = 0
+        content: str = ""
+        id: str = ""
+
+    class _Metadata(msgspec.Struct):
+        name: object = None
+        display_name: object = None
+        nip05: object = None
+
+    _decode_envelope = msgspec.json.Decoder(list[msgspec.Raw]).decode
+    _decode_event = msgspec.json.Decoder(_Event).decode
+    _decode_metadata = msgspec.json.Decoder(_Metadata).decode
+    _decode_str = msgspec.json.Decoder(str).decode
+    _loads = msgspec.json.decode
+else:
+    JSON_BACKEND = "json"
+    _loads = json.loads
+
+def peek_kind(raw):
+    """Read an event's kind from the raw message without parsing it, or return None."""
+    start = raw.find('"kind":')
+    if start >= 0:
+        start += 7
+        end = start
+        while end < len(raw) and raw[end].isdigit():
+            end += 1
+        if end > start:
+            return int(raw[start:end])
+    match = KIND_PATTERN.search(raw)
+    return int(match.group(1)) if match else None
+
+def decode_message(raw, kinds=None):
+    """Decode a relay message into a list, or return None to drop it.
+
+    EVENT messages whose kind is not in kinds are dropped before any JSON
+    parsing. orjson is used when installed; otherwise with msgspec, events
+    are decoded into a typed struct that skips tags and other fields we
+    never read. Event content is left as
+    a string; use decode_metadata on the events that are kept.
+    """
+    is_event = raw.startswith(EVENT_PREFIX)
+    if is_event and kinds is not None:
+        kind = peek_kind(raw)
+        if kind is not None and kind not in kinds:
+            return None
+    if JSON_BACKEND == "msgspec" and is_event:
+        parts = _decode_envelope(raw)
+        if len(parts) < 3:
+            return None
+        event = _decode_event(parts[2])
+        return ["EVENT", _decode_str(parts[1]), {
+            "id": event.id, "pubkey": event.pubkey, "kind": event.kind,
+            "created_at": event.created_at, "content": event.content,
+        }]
+    data = _loads(raw)
+    return data if isinstance(data, list) else None
+
+def decode_metadata(content):
+    """Decode kind-0 content, returning only the fields we report.
 
-            request = json.dumps(["REQ", "search", query])
-            await websocket.send(request)
+    Fields that are not strings are dropped, as if they were missing.
+    """
+    if JSON_BACKEND == "msgspec":
+        metadata = _decode_metadata(content)
+        return {field: getattr(metadata, field) for field in METADATA_FIELDS
+                if isinstance(getattr(metadata, field), str)}
+    data = _loads(content)
+    if not isinstance(data, dict):
+        raise ValueError("metadata is not a JSON object")
+    return {field: data[field] for field in METADATA_FIELDS if isinstance(data.get(field), str)}
 
+_ssl_context = None
+
+def get_ssl_context():
+    """Return the shared SSL context, loading the CA bundle only once."""
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context(cafile=certifi.where())
+    return _ssl_context
+
+def normalize_relay_url(relay):
+    relay = relay.strip()
+    if "://" not in relay:
+        relay = "wss://" + relay
+    return relay.rstrip("/")
+
+class RelayConnection:
+    """One open websocket to a relay, shared by many subscriptions.
+
+    A background reader routes EVENT, EOSE and CLOSED messages to the queue
+    of the subscription id they belong to.
+    """
+
+    def __init__(self, url, websocket, sub_prefix, record=None):
+        self.url = url
+        self.websocket = websocket
+        self.record = record
+        self.closed = False
+        self.subscriptions = {}
+        self.kinds = {}
+        self._sub_ids = (f"{sub_prefix}{n}" for n in itertools.count())
+        self._reader = asyncio.create_task(self._read())
+
+    def wanted_kinds(self):
+        """Event kinds any open subscription asked for, or None if one accepts all kinds."""
+        wanted = set()
+        for kinds in self.kinds.values():
+            if kinds is None:
+                return None
+            wanted.update(kinds)
+        return wanted
+
+    async def _read(self):
+        try:
+            async for message in self.websocket:
+                if isinstance(message, bytes):
+                    message = message.decode("utf-8", "replace")
+                if self.record:
+                    # Raw newlines can only be JSON whitespace, so this keeps one frame per line
+                    self.record.write(message.replace("\n", " ") + "\n")
+                try:
+                    data = decode_message(message, self.wanted_kinds())
+                except ValueError:
+                    continue
+                if data and len(data) >= 2 and data[0] in ("EVENT", "EOSE", "CLOSED"):
+                    queue = self.subscriptions.get(data[1])
+                    if queue is not None:
+                        queue.put_nowait(data)
+        except WebSocketException:
+            pass
+        finally:
+            self.closed = True
+            for queue in self.subscriptions.values():
+                queue.put_nowait(None)
+
+    async def subscribe(self, filters, timeout=5.0):
+        """Send a REQ with a unique subscription id and yield its events until EOSE.
+
+        A matching CLOSE is sent when the caller stops iterating, whether or
+        not EOSE has arrived. timeout bounds the wait for each message.
+        """
+        if self.closed:
+            raise ConnectionClosedError(None, None)
+        sub_id = next(self._sub_ids)
+        queue = asyncio.Queue()
+        self.subscriptions[sub_id] = queue
+        self.kinds[sub_id] = None if any("kinds" not in f for f in filters) else {k for f in filters for k in f["kinds"]}
+        try:
+            await self.websocket.send(json.dumps(["REQ", sub_id, *filters]))
             while True:
-                response = await asyncio.wait_for(websocket.recv(), timeout=5.0)
-                data = json.loads(response)
-                if data[0] == "EVENT" and data[2]["kind"] == 0:
-                    content = json.loads(data[2]["content"])
-                    return {
-                        "relay": relay_url,
-                        "pubkey": data[2]["pubkey"],
-                        "name": content.get("name", "Unknown"),
-                        "display_name": content.get("display_name", "Unknown"),
-                        "nip05": content.get("nip05", "Unknown"),
-                    }
-                elif data[0] == "EOSE":
+                message = await asyncio.wait_for(queue.get(), timeout=timeout)
+                if message is None:
+                    raise ConnectionClosedError(None, None)
+                if message[0] != "EVENT":
                     break
+                if len(message) >= 3 and isinstance(message[2], dict):
+                    yield message[2]
+        finally:
+            del self.subscriptions[sub_id]
+            del self.kinds[sub_id]
+            if not self.closed:
+                with contextlib.suppress(*RELAY_ERRORS):
+                    await self.websocket.send(json.dumps(["CLOSE", sub_id]))
+
+    async def close(self):
+        self.closed = True
+        with contextlib.suppress(*RELAY_ERRORS):
+            await self.websocket.close()
+        self._reader.cancel()
+
+class RelayHealth:
+    """Per-relay connect time, time to EOSE, error rate and hit rate.
+
+    Measurements are kept in memory while searching and written to SQLite
+    by save(), so the ranking improves from run to run. Latencies are
+    exponentially weighted moving averages in milliseconds.
+    """
+
+    FIELDS = ("connects", "connect_failures", "connect_ms", "queries", "hits", "errors", "eose_ms")
+    ALPHA = 0.3
+    DEFAULT_LATENCY_MS = 1500.0
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS relay_health (
+            relay TEXT PRIMARY KEY,
+            connects INTEGER NOT NULL DEFAULT 0,
+            connect_failures INTEGER NOT NULL DEFAULT 0,
+            connect_ms REAL,
+            queries INTEGER NOT NULL DEFAULT 0,
+            hits INTEGER NOT NULL DEFAULT 0,
+            errors INTEGER NOT NULL DEFAULT 0,
+            eose_ms REAL
+        )""")
+        self.stats = {row[0]: dict(zip(self.FIELDS, row[1:]))
+                      for row in self.db.execute(f"SELECT relay, {', '.join(self.FIELDS)} FROM relay_health")}
+
+    def _get(self, relay):
+        relay = normalize_relay_url(relay)
+        if relay not in self.stats:
+            self.stats[relay] = dict.fromkeys(self.FIELDS, 0)
+            self.stats[relay]["connect_ms"] = self.stats[relay]["eose_ms"] = None
+        return self.stats[relay]
+
+    def _average(self, stats, field, seconds):
+        ms = seconds * 1000
+        stats[field] = ms if stats[field] is None else (1 - self.ALPHA) * stats[field] + self.ALPHA * ms
+
+    def record_connect(self, relay, seconds):
+        """Record a connection attempt; seconds is None if it failed."""
+        stats = self._get(relay)
+        if seconds is None:
+            stats["connect_failures"] += 1
+        else:
+            stats["connects"] += 1
+            self._average(stats, "connect_ms", seconds)
 
-    except (websockets.exceptions.WebSocketException, asyncio.TimeoutError) as e:
+    def record_query(self, relay, seconds, hit=False, complete=True):
+        """Record how long a query ran.
+
+        Queries the caller cut short without a hit are left out of the hit rate.
+        """
+        stats = self._get(relay)
+        self._average(stats, "eose_ms", seconds)
+        if complete or hit:
+            stats["queries"] += 1
+            stats["hits"] += int(hit)
+
+    def record_error(self, relay):
+        self._get(relay)["errors"] += 1
+
+    def score(self, relay):
+        """Higher is better: reliability times hit rate per second of latency.
+
+        Laplace smoothing gives relays with no history an optimistic score so
+        they still get tried.
+        """
+        stats = self._get(relay)
+        attempts = stats["connects"] + stats["connect_failures"] + stats["errors"]
+        reliability = (stats["connects"] + 1) / (attempts + 1)
+        hit_rate = (stats["hits"] + 1) / (stats["queries"] + 2)
+        latency = ((stats["connect_ms"] or self.DEFAULT_LATENCY_MS) + (stats["eose_ms"] or self.DEFAULT_LATENCY_MS)) / 1000
+        return reliability * hit_rate / (latency + 0.1)
+
+    def rank(self, relays):
+        return sorted(relays, key=self.score, reverse=True)
+
+    def auto_limit(self, minimum=3, maximum=10):
+        """Number of relays to try first in auto mode: every relay that has produced a hit, within bounds."""
+        with_hits = sum(1 for stats in self.stats.values() if stats["hits"])
+        return max(minimum, min(maximum, with_hits))
+
+    def save(self):
+        self.db.executemany(f"INSERT OR REPLACE INTO relay_health VALUES (?, {', '.join('?' * len(self.FIELDS))})",
+                            [(relay, *(stats[field] for field in self.FIELDS)) for relay, stats in self.stats.items()])
+        self.db.commit()
+
+    def close(self):
+        self.save()
+        self.db.close()
+
+class RelayPool:
+    """Keeps one websocket per relay open for reuse across lookups.
+
+    If a RelayHealth is given, connect times and failures are recorded in it.
+    If record is an open text file, every raw relay message is appended to it
+    (one per line), for replaying with nostr-decode-bench.py.
+    """
+
+    def __init__(self, connect_timeout=5.0, health=None, record=None):
+        self.connect_timeout = connect_timeout
+        self.health = health
+        self.record = record
+        self.connections = {}
+        self._locks = {}
+        self._sub_prefix = secrets.token_hex(4) + ":"
+
+    async def get(self, relay_url):
+        """Return an open connection to relay_url, connecting if needed."""
+        url = normalize_relay_url(relay_url)
+        connection = self.connections.get(url)
+        if connection is not None and not connection.closed:
+            return connection
+        lock = self._locks.setdefault(url, asyncio.Lock())
+        async with lock:
+            connection = self.connections.get(url)
+            if connection is None or connection.closed:
+                ssl_context = get_ssl_context() if url.startswith("wss://") else None
+                started = time.monotonic()
+                try:
+                    websocket = await asyncio.wait_for(websockets.connect(url, ssl=ssl_context),
+                                                       timeout=self.connect_timeout)
+                except RELAY_ERRORS:
+                    if self.health:
+                        self.health.record_connect(url, None)
+                    raise
+                if self.health:
+                    self.health.record_connect(url, time.monotonic() - started)
+                connection = self.connections[url] = RelayConnection(url, websocket, self._sub_prefix, self.record)
+            return connection
+
+    async def close(self):
+        connections = list(self.connections.values())
+        self.connections.clear()
+        await asyncio.gather(*(connection.close() for connection in connections))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+
+def _bech32_polymod(values):
+    generator = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
+    checksum = 1
+    for value in values:
+        top = checksum >> 25
+        checksum = (checksum & 0x1ffffff) << 5 ^ value
+        for i in range(5):
+            checksum ^= generator[i] if (top >> i) & 1 else 0
+    return checksum
+
+def decode_npub(npub):
+    """Decode a NIP-19 npub string to a hex public key, or return None."""
+    npub = npub.lower()
+    hrp, sep, data = npub.rpartition("1")
+    if hrp != "npub" or not sep or len(data) < 6 or any(c not in BECH32_CHARSET for c in data):
+        return None
+    values = [BECH32_CHARSET.index(c) for c in data]
+    expanded = [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+    if _bech32_polymod(expanded + values) != 1:
+        return None
+    accumulator, bits, key = 0, 0, bytearray()
+    for value in values[:-6]:
+        accumulator = (accumulator << 5) | value
+        bits += 5
+        if bits >= 8:
+            bits -= 8
+            key.append((accumulator >> bits) & 0xff)
+    return key.hex() if len(key) == 32 else None
+
+def normalize_pubkey(value):
+    """Return a lower-case hex public key for a hex or npub value, or None."""
+    value = value.strip()
+    if value.lower().startswith("npub1"):
+        return decode_npub(value)
+    if len(value) == 64 and all(c in '0123456789abcdef' for c in value.lower()):
+        return value.lower()
+    return None
+
+def build_filter(identifier):
+    # Check if the identifier is a public key (hex or npub) or a NIP-05 identifier
+    pubkey = normalize_pubkey(identifier)
+    if pubkey:
+        return {
+            "kinds": [0],  # Metadata event
+            "authors": [pubkey],
+        }
+    # Treat it as a NIP-05 identifier
+    return {
+        "kinds": [0],  # Metadata event
+        "search": identifier,
+    }
+
+NIP05_PATTERN = re.compile(r"^([a-z0-9._-]+)@([a-z0-9-]+(?:\.[a-z0-9-]+)+)$", re.IGNORECASE)
+
+def parse_nip05(identifier):
+    """Split a name@domain identifier into (name, domain), or return None."""
+    match = NIP05_PATTERN.match(identifier.strip())
+    return (match.group(1).lower(), match.group(2).lower()) if match else None
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # NIP-05: fetchers must ignore redirects from /.well-known/nostr.json
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+def fetch_nip05(name, domain, timeout=5.0):
+    """Fetch the domain's nostr.json and return (pubkey, relay hints) for name."""
+    url = f"https://{domain}/.well-known/nostr.json?{urlencode({'name': name})}"
+    opener = urllib.request.build_opener(_NoRedirect, urllib.request.HTTPSHandler(context=get_ssl_context()))
+    request = urllib.request.Request(url, headers={"Accept": "application/json"})
+    with opener.open(request, timeout=timeout) as response:
+        data = json.loads(response.read(1024 * 1024))
+    names = {key.lower(): value for key, value in (data.get("names") or {}).items() if isinstance(value, str)}
+    pubkey = normalize_pubkey(names.get(name, ""))
+    if pubkey is None:
+        return None, []
+    relays = data.get("relays")
+    relays = relays.get(pubkey) if isinstance(relays, dict) else None
+    if not isinstance(relays, list):
+        return pubkey, []
+    return pubkey, [relay for relay in relays if isinstance(relay, str)]
+
+async def resolve_nip05(identifier, index=None, ttl=86400, verbose=False):
+    """Resolve name@domain to (pubkey, relay hints), using the index as a TTL cache.
+
+    Returns None if the identifier is not a NIP-05 address or the domain
+    could not be queried; network failures are not cached.
+    """
+    parsed = parse_nip05(identifier)
+    if parsed is None:
+        return None
+    key = "@".join(parsed)
+    if index:
+        cached = index.get_nip05(key, ttl)
+        if cached:
+            if verbose:
+                print(f"Using cached NIP-05 resolution for {key}", file=sys.stderr)
+            return cached
+    try:
+        pubkey, relays = await asyncio.to_thread(fetch_nip05, *parsed)
+    except (urllib.error.URLError, OSError, ValueError, AttributeError) as e:
+        if verbose:
+            print(f"NIP-05 lookup for {key} failed: {e}", file=sys.stderr)
+        return None
+    if index:
+        index.put_nip05(key, pubkey, relays)
+    return pubkey, relays
+
+async def search_tiers(search, relays, health=None, max_relays=None, verbose=False):
+    """Run search(subset) on the best-ranked relays first, widening only if nothing is found.
+
+    The first tier holds max_relays relays and each following tier doubles
+    in size. Without a limit or health data, all relays are searched at once.
+    """
+    if not max_relays or health is None:
+        return await search(relays)
+    ranked = health.rank(relays)
+    start, size = 0, max_relays
+    while start < len(ranked):
+        tier = ranked[start:start + size]
         if verbose:
-            print(f"Error searching {relay_url}: {str(e)}")
+            print(f"Querying {len(tier)} relays ranked {start + 1}-{start + len(tier)}", file=sys.stderr)
+        results = await search(tier)
+        if results:
+            return results
+        start, size = start + size, size * 2
+    return []
+
+async def search_identifier(identifier, relays, verbose=False, pool=None, first_hit=False, deadline=10.0,
+                            index=None, nip05_ttl=86400, max_relays=None):
+    """Search for an identifier, resolving NIP-05 addresses directly first.
+
+    A name@domain identifier is resolved through the domain's nostr.json,
+    then only an authors query is sent, to the relays it recommends (or to
+    relays if it lists none). The free-text search filter is used only when
+    the identifier is not a NIP-05 address or its domain cannot be reached.
+    With max_relays, relays are queried best-ranked first (see search_tiers).
+    """
+    if pool is None:
+        async with RelayPool() as pool:
+            return await search_identifier(identifier, relays, verbose, pool, first_hit, deadline,
+                                           index, nip05_ttl, max_relays)
+
+    def across_relays(query):
+        return search_tiers(lambda tier: search_nostr_users(query, tier, verbose, pool, first_hit, deadline),
+                            relays, pool.health, max_relays, verbose)
+
+    resolved = await resolve_nip05(identifier, index, nip05_ttl, verbose)
+    if resolved is None:
+        return await across_relays(identifier)
+    pubkey, hints = resolved
+    if pubkey is None:
+        if verbose:
+            print(f"{identifier} is not registered on its NIP-05 domain", file=sys.stderr)
+        return []
+    if verbose:
+        print(f"Resolved {identifier} to {pubkey} ({len(hints)} relay hints)", file=sys.stderr)
+    results = []
+    if hints:
+        results = await search_nostr_users(pubkey, hints, verbose, pool, first_hit, deadline)
+    if not results:
+        results = await across_relays(pubkey)
+    return results
+
+def parse_profile(relay_url, event):
+    """Turn a kind-0 event into a profile record, or None if it is not usable."""
+    if event.get("kind") != 0:
+        return None
+    pubkey, created_at = event.get("pubkey"), event.get("created_at", 0)
+    if not isinstance(pubkey, str) or not isinstance(created_at, int):
+        return None
+    try:
+        content = decode_metadata(event["content"])
+        return {
+            "relay": relay_url,
+            "pubkey": pubkey,
+            "created_at": created_at,
+            "name": content.get("name"),
+            "display_name": content.get("display_name"),
+            "nip05": content.get("nip05"),
+        }
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+async def fetch_profiles(relay_url, filters, verbose=False, pool=None, timeout=5.0):
+    """Yield profiles from one relay as they arrive, until EOSE."""
+    if verbose:
+        print(f"Searching {relay_url}...", file=sys.stderr)
+    health = pool.health
+    hit = complete = failed = False
+    started = None
+    try:
+        connection = await pool.get(relay_url)
+        started = time.monotonic()
+        async with contextlib.aclosing(connection.subscribe(filters, timeout=timeout)) as events:
+            async for event in events:
+                profile = parse_profile(relay_url, event)
+                if profile:
+                    hit = True
+                    yield profile
+        complete = True
+    except RELAY_ERRORS as e:
+        failed = True
+        if verbose:
+            print(f"Error searching {relay_url}: {str(e) or type(e).__name__}", file=sys.stderr)
+    finally:
+        if health and started is not None:
+            if failed:
+                health.record_error(relay_url)
+            else:
+                # Queries cut short by the caller still tell us how slow the relay was
+                health.record_query(relay_url, time.monotonic() - started, hit, complete)
+
+async def search_user(relay_url, identifier, verbose=False, pool=None):
+    if pool is None:
+        async with RelayPool() as pool:
+            return await search_user(relay_url, identifier, verbose, pool)
+    async with contextlib.aclosing(fetch_profiles(relay_url, [build_filter(identifier)], verbose, pool)) as profiles:
+        async for profile in profiles:
+            return profile
     return None
 
-async def search_nostr_users(identifier, relays, verbose=False):
-    tasks = [search_user(relay, identifier, verbose) for relay in relays]
-    results = await asyncio.gather(*tasks)
-    return next((result for result in results if result), None)
+async def search_nostr_users(identifier, relays, verbose=False, pool=None, first_hit=False, deadline=10.0):
+    """Search all relays concurrently and process results as they arrive.
+
+    With first_hit the first profile found is returned as soon as it
+    arrives. Otherwise profiles are collected from every relay and
+    de-duplicated by pubkey, keeping the event with the newest created_at.
+    Relays still running when the deadline (in seconds) passes are
+    cancelled. Returns a list of profiles, newest first.
+    """
+    if pool is None:
+        async with RelayPool() as pool:
+            return await search_nostr_users(identifier, relays, verbose, pool, first_hit, deadline)
+
+    filters = [build_filter(identifier)]
+    queue = asyncio.Queue()
+
+    async def pump(relay):
+        try:
+            async for profile in fetch_profiles(relay, filters, verbose, pool, timeout=None):
+                queue.put_nowait(profile)
+        finally:
+            queue.put_nowait(None)
+
+    tasks = [asyncio.create_task(pump(relay)) for relay in relays]
+    profiles = {}
+    remaining = len(tasks)
+    loop = asyncio.get_running_loop()
+    end = loop.time() + deadline
+    try:
+        while remaining:
+            try:
+                profile = await asyncio.wait_for(queue.get(), timeout=max(0, end - loop.time()))
+            except asyncio.TimeoutError:
+                if verbose:
+                    print(f"Deadline reached with {remaining} relays still searching", file=sys.stderr)
+                break
+            if profile is None:
+                remaining -= 1
+                continue
+            if first_hit:
+                return [profile]
+            current = profiles.get(profile["pubkey"])
+            if current is None or profile["created_at"] > current["created_at"]:
+                profiles[profile["pubkey"]] = profile
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return sorted(profiles.values(), key=lambda profile: profile["created_at"], reverse=True)
+
+class MetadataIndex:
+    """Local SQLite index of kind-0 metadata with full-text search.
+
+    Profiles are keyed by pubkey and only replaced by newer events. An FTS5
+    table over name, display_name and nip05 serves offline name searches.
+    Each relay has a sync checkpoint so later syncs only fetch new events.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS profiles (
+                pubkey TEXT PRIMARY KEY,
+                created_at INTEGER NOT NULL,
+                name TEXT,
+                display_name TEXT,
+                nip05 TEXT,
+                relay TEXT,
+                fetched_at REAL NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS profiles_fts USING fts5(
+                name, display_name, nip05, content='profiles', content_rowid='rowid'
+            );
+            CREATE TRIGGER IF NOT EXISTS profiles_ai AFTER INSERT ON profiles BEGIN
+                INSERT INTO profiles_fts(rowid, name, display_name, nip05)
+                VALUES (new.rowid, new.name, new.display_name, new.nip05);
+            END;
+            CREATE TRIGGER IF NOT EXISTS profiles_ad AFTER DELETE ON profiles BEGIN
+                INSERT INTO profiles_fts(profiles_fts, rowid, name, display_name, nip05)
+                VALUES ('delete', old.rowid, old.name, old.display_name, old.nip05);
+            END;
+            CREATE TRIGGER IF NOT EXISTS profiles_au AFTER UPDATE OF name, display_name, nip05 ON profiles BEGIN
+                INSERT INTO profiles_fts(profiles_fts, rowid, name, display_name, nip05)
+                VALUES ('delete', old.rowid, old.name, old.display_name, old.nip05);
+                INSERT INTO profiles_fts(rowid, name, display_name, nip05)
+                VALUES (new.rowid, new.name, new.display_name, new.nip05);
+            END;
+            CREATE TABLE IF NOT EXISTS nip05 (
+                identifier TEXT PRIMARY KEY,
+                pubkey TEXT,
+                relays TEXT NOT NULL,
+                resolved_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sync_state (
+                relay TEXT PRIMARY KEY,
+                since INTEGER NOT NULL DEFAULT 0,
+                top INTEGER NOT NULL DEFAULT 0,
+                until INTEGER
+            );
+        """)
+
+    def upsert(self, profiles):
+        """Store profiles, keeping the newest event per pubkey."""
+        now = time.time()
+        self.db.executemany("""
+            INSERT INTO profiles (pubkey, created_at, name, display_name, nip05, relay, fetched_at)
+            VALUES (:pubkey, :created_at, :name, :display_name, :nip05, :relay, :fetched_at)
+            ON CONFLICT(pubkey) DO UPDATE SET
+                created_at = excluded.created_at, name = excluded.name,
+                display_name = excluded.display_name, nip05 = excluded.nip05,
+                relay = excluded.relay, fetched_at = excluded.fetched_at
+            WHERE excluded.created_at > profiles.created_at
+        """, [dict(profile, fetched_at=now) for profile in profiles])
+        # An equal or older event still confirms the stored one is current
+        self.db.executemany("UPDATE profiles SET fetched_at = ? WHERE pubkey = ? AND created_at >= ?",
+                            [(now, profile["pubkey"], profile["created_at"]) for profile in profiles])
+        self.db.commit()
+
+    def _rows(self, cursor):
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def search(self, identifier, limit=20):
+        """Return indexed profiles matching a pubkey or a name/display_name/nip05 phrase."""
+        pubkey = normalize_pubkey(identifier)
+        if pubkey:
+            return self._rows(self.db.execute("SELECT * FROM profiles WHERE pubkey = ?", (pubkey,)))
+        phrase = '"' + identifier.replace('"', '""') + '"'
+        return self._rows(self.db.execute("""
+            SELECT profiles.* FROM profiles_fts JOIN profiles ON profiles.rowid = profiles_fts.rowid
+            WHERE profiles_fts MATCH ? ORDER BY rank LIMIT ?
+        """, (phrase, limit)))
+
+    def get_state(self, relay):
+        row = self.db.execute("SELECT since, top, until FROM sync_state WHERE relay = ?", (relay,)).fetchone()
+        return row or (0, 0, None)
+
+    def set_state(self, relay, since, top, until):
+        self.db.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)", (relay, since, top, until))
+        self.db.commit()
+
+    def get_nip05(self, identifier, ttl):
+        """Return a cached (pubkey, relays) resolution younger than ttl seconds, else None.
+
+        pubkey is None when the domain was reached but does not list the name.
+        """
+        row = self.db.execute("SELECT pubkey, relays, resolved_at FROM nip05 WHERE identifier = ?",
+                              (identifier,)).fetchone()
+        if row is None or time.time() - row[2] > ttl:
+            return None
+        return row[0], json.loads(row[1])
+
+    def put_nip05(self, identifier, pubkey, relays):
+        self.db.execute("INSERT OR REPLACE INTO nip05 VALUES (?, ?, ?, ?)",
+                        (identifier, pubkey, json.dumps(relays), time.time()))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+async def fetch_page(relay, query, pool, timeout):
+    """Return all profiles for one query, raising on relay errors or timeout."""
+    async def collect():
+        connection = await pool.get(relay)
+        async with contextlib.aclosing(connection.subscribe([query], timeout=timeout)) as events:
+            return [profile async for profile in (parse_profile(relay, event) async for event in events) if profile]
+    return await asyncio.wait_for(collect(), timeout=timeout)
+
+# Seconds a relay's events may be stamped ahead of the local clock
+CLOCK_SKEW = 900
+
+async def sync_relay(index, relay, pool, verbose=False, page_size=500, max_pages=20, timeout=15.0):
+    """Pull new kind-0 events from one relay into the index.
+
+    Pages backwards from now (or from where an interrupted sync stopped)
+    down to the relay's checkpoint using since/until. The checkpoint only
+    advances once the walk reaches it, so an interrupted or failed sync
+    resumes without gaps. It then becomes the time the walk started less
+    CLOCK_SKEW, never the newest created_at seen: an event stamped in the
+    future must not hide events published later with earlier timestamps.
+    Returns the number of events received.
+    """
+    since, top, until = index.get_state(relay)
+    if until is None:
+        # Leave room for events stamped slightly in the future by skewed clocks
+        started = int(time.time())
+        until, top = started + CLOCK_SKEW, started - CLOCK_SKEW
+        # Earlier versions could leave the checkpoint in the future
+        since = min(since, top)
+    received = 0
+    for _ in range(max_pages):
+        query = {"kinds": [0], "since": since, "until": until, "limit": page_size}
+        try:
+            page = await fetch_page(relay, query, pool, timeout)
+        except RELAY_ERRORS as e:
+            if verbose:
+                print(f"Error syncing {relay}: {str(e) or type(e).__name__}", file=sys.stderr)
+            break
+        if not page:
+            # Walked all the way down to the checkpoint
+            index.set_state(relay, top, top, None)
+            break
+        index.upsert(page)
+        received += len(page)
+        oldest = min(profile["created_at"] for profile in page)
+        # until is inclusive, so step past it once a page makes no progress
+        until = oldest - 1 if oldest >= until else oldest
+        index.set_state(relay, since, top, until)
+    if verbose:
+        print(f"Synced {received} events from {relay}", file=sys.stderr)
+    return received
+
+async def sync_index(index, relays, verbose=False, pool=None, concurrency=50):
+    """Incrementally sync the index from every relay. Returns the events received."""
+    if pool is None:
+        async with RelayPool() as pool:
+            return await sync_index(index, relays, verbose, pool, concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(relay):
+        async with semaphore:
+            return await sync_relay(index, normalize_relay_url(relay), pool, verbose)
+
+    return sum(await asyncio.gather(*(run(relay) for relay in relays)))
+
+async def indexed_search(identifier, relays, index, max_age, verbose=False, offline=False,
+                         first_hit=False, deadline=10.0, nip05_ttl=86400, pool=None, max_relays=None):
+    """Answer a search from the index, going to relays only when needed.
+
+    A NIP-05 identifier is resolved first (the resolution is cached in the
+    index) and looked up by the pubkey its domain lists, because the nip05
+    field of a profile is self-asserted. Offline, any cached resolution is
+    used; the name search serves as a fallback only when the identifier
+    cannot be resolved. Fresh index hits are returned directly. Stale hits
+    are refreshed with a targeted authors query; with no hits at all the
+    normal relay search runs. Relay results are written back to the index.
+    """
+    if pool is None and not offline:
+        async with RelayPool() as pool:
+            return await indexed_search(identifier, relays, index, max_age, verbose, offline,
+                                        first_hit, deadline, nip05_ttl, pool, max_relays)
+    query = identifier
+    parsed = parse_nip05(identifier)
+    if parsed:
+        if offline:
+            resolved = index.get_nip05("@".join(parsed), float("inf"))
+        else:
+            resolved = await resolve_nip05(identifier, index, nip05_ttl, verbose)
+        if resolved is not None:
+            if resolved[0] is None:
+                if verbose:
+                    print(f"{identifier} is not registered on its NIP-05 domain", file=sys.stderr)
+                return []
+            query = resolved[0]
+        elif verbose:
+            print(f"Could not resolve {identifier}; searching unverified nip05 fields", file=sys.stderr)
+    hits = index.search(query)
+    cutoff = time.time() - max_age
+    stale = [hit["pubkey"] for hit in hits if hit["fetched_at"] < cutoff]
+    if offline or (hits and not stale):
+        if verbose:
+            print(f"Answered from local index ({len(hits)} profiles)", file=sys.stderr)
+        return hits
+    if hits:
+        if verbose:
+            print(f"Refreshing {len(stale)} stale profiles from relays", file=sys.stderr)
+        refreshed = await search_tiers(
+            lambda tier: lookup_chunk(stale, tier, verbose, pool, deadline),
+            relays, pool.health, max_relays, verbose)
+        index.upsert(refreshed.values() if refreshed else [])
+        return index.search(query)
+    if parsed and resolved is None:
+        # Resolution just failed; do not ask the domain again
+        results = await search_tiers(
+            lambda tier: search_nostr_users(identifier, tier, verbose, pool, first_hit, deadline),
+            relays, pool.health, max_relays, verbose)
+    else:
+        results = await search_identifier(identifier, relays, verbose, pool, first_hit, deadline,
+                                          index, nip05_ttl, max_relays)
+    index.upsert(results)
+    return results
+
+def get_pubkeys_from_file(file_path):
+    """Read public keys from a file, skipping invalid and duplicate entries."""
+    pubkeys = []
+    seen = set()
+    with open(file_path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            pubkey = normalize_pubkey(line)
+            if pubkey is None:
+                print(f"Skipping invalid public key: {line.strip()}", file=sys.stderr)
+            elif pubkey not in seen:
+                seen.add(pubkey)
+                pubkeys.append(pubkey)
+    return pubkeys
+
+async def lookup_chunk(chunk, relays, verbose, pool, timeout):
+    """Fetch metadata for a chunk of pubkeys with one subscription per relay.
+
+    Returns the newest profile per pubkey found on any relay.
+    """
+    filters = [{"kinds": [0], "authors": chunk}]
+    newest = {}
+
+    async def collect(relay):
+        async for profile in fetch_profiles(relay, filters, verbose, pool, timeout=None):
+            current = newest.get(profile["pubkey"])
+            if current is None or profile["created_at"] > current["created_at"]:
+                newest[profile["pubkey"]] = profile
+
+    tasks = [asyncio.create_task(collect(relay)) for relay in relays]
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return newest
+
+async def batch_lookup(pubkeys, relays, output, verbose=False, pool=None, chunk_size=250,
+                       concurrent_chunks=4, timeout=15.0, index=None):
+    """Resolve many pubkeys and write one JSON line per pubkey.
+
+    Pubkeys are packed into multi-author kind-0 filters of chunk_size keys,
+    so each relay sees one subscription per chunk rather than one per key.
+    A chunk's results are written as soon as all relays have answered it
+    (or timeout seconds pass), and stored in the index if one is given.
+    Returns the number of pubkeys found.
+    """
+    if pool is None:
+        async with RelayPool() as pool:
+            return await batch_lookup(pubkeys, relays, output, verbose, pool, chunk_size,
+                                      concurrent_chunks, timeout, index)
+
+    semaphore = asyncio.Semaphore(concurrent_chunks)
+    found = 0
+
+    async def run(chunk):
+        nonlocal found
+        async with semaphore:
+            newest = await lookup_chunk(chunk, relays, verbose, pool, timeout)
+        if index:
+            index.upsert(newest.values())
+        for pubkey in chunk:
+            profile = newest.get(pubkey)
+            record = dict(profile, found=True) if profile else {"pubkey": pubkey, "found": False}
+            output.write(dumps(record) + "\n")
+        output.flush()
+        found += len(newest)
+
+    chunks = [pubkeys[i:i + chunk_size] for i in range(0, len(pubkeys), chunk_size)]
+    await asyncio.gather(*(run(chunk) for chunk in chunks))
+    return found
 
 def main():
     description = "Search for a Nostr user across multiple relays."
@@ -80,44 +966,133 @@ def main():
 
     parser = argparse.ArgumentParser(description=description, epilog=epilog,
                                      formatter_class=argparse.RawDescriptionHelpFormatter)
-    parser.add_argument("identifier", help="The Nostr user identifier (public key or NIP-05) to search for")
+    parser.add_argument("identifier", nargs='?', help="The Nostr user identifier (public key or NIP-05) to search for")
     parser.add_argument("-r", "--relays", nargs='+', default=DEFAULT_RELAYS,
                         help="List of Nostr relays to search (default: use a predefined list)")
     parser.add_argument("-f", "--file", help="File containing a list of Nostr relays to search")
     parser.add_argument("-v", "--verbose", action="store_true", help="Enable verbose output")
+    parser.add_argument("-1", "--first-hit", action="store_true", help="Stop at the first matching profile instead of collecting from all relays")
+    parser.add_argument("-t", "--timeout", type=float, default=10.0, help="Overall search deadline in seconds (default: 10)")
+    parser.add_argument("-b", "--batch", help="File containing public keys (hex or npub) to look up (batch mode, JSONL output)")
+    parser.add_argument("-o", "--output", help="Write batch results to this JSONL file instead of stdout")
+    parser.add_argument("--chunk-size", type=int, default=250, help="Number of public keys per relay subscription in batch mode (default: 250)")
+    parser.add_argument("--index", help="Local metadata index file (default: ~/.cache/osint-user-discovery/nostr-index.sqlite)")
+    parser.add_argument("--no-index", action="store_true", help="Do not use the local metadata index")
+    parser.add_argument("--sync", action="store_true", help="Incrementally sync kind-0 metadata from the relays into the index first")
+    parser.add_argument("--offline", action="store_true", help="Search the local index only, without contacting relays")
+    parser.add_argument("--max-age", type=float, default=24, help="Hours before an indexed profile is refreshed from relays (default: 24)")
+    parser.add_argument("--nip05-ttl", type=float, default=24, help="Hours to cache NIP-05 (name@domain) resolutions (default: 24)")
+    parser.add_argument("--max-relays", metavar="N|auto", help="Query only the N best-ranked relays first, widening if nothing is found ('auto' picks N from past hits)")
+    parser.add_argument("--relay-stats", action="store_true", help="Show the recorded relay health ranking and exit")
+    parser.add_argument("--record", metavar="FILE", help="Append every raw relay message to FILE (for nostr-decode-bench.py)")
     
     args = parser.parse_args()
+
+    if not args.identifier and not args.batch and not args.sync and not args.relay_stats:
+        parser.error("an identifier, --batch file or --sync is required")
+    if args.max_relays and args.max_relays != "auto" and not args.max_relays.isdigit():
+        parser.error("--max-relays must be a number or 'auto'")
+    if args.no_index and (args.sync or args.offline):
+        parser.error("--sync and --offline need the local index")
+
+    # Batch results may be streamed to stdout, so keep status messages on stderr
+    log = sys.stderr if args.batch else sys.stdout
     
-    print("Nostr User Search Script")
-    print("Created by inforensics.ai")
-    print()
+    print("Nostr User Search Script", file=log)
+    print("Created by inforensics.ai", file=log)
+    print(file=log)
 
     if args.verbose:
-        print("Verbose mode enabled")
+        print("Verbose mode enabled", file=log)
     
     if args.file:
         with open(args.file, 'r') as f:
             relays = [line.strip() for line in f if line.strip()]
-        print(f"Using {len(relays)} relays from file: {args.file}")
+        print(f"Using {len(relays)} relays from file: {args.file}", file=log)
     else:
         relays = args.relays
-        print(f"Using {len(relays)} provided relays.")
+        print(f"Using {len(relays)} provided relays.", file=log)
     
     if not relays:
-        print("No relays available to search. Please check your input.")
+        print("No relays available to search. Please check your input.", file=log)
         return
 
-    print(f"Searching for user {args.identifier} across {len(relays)} relays...")
-    result = asyncio.run(search_nostr_users(args.identifier, relays, args.verbose))
+    health = RelayHealth(cache_path('nostr-relay-health.sqlite'))
+
+    if args.relay_stats:
+        print_relay_stats(health, relays)
+        health.close()
+        return
+
+    index = None if args.no_index else MetadataIndex(args.index or cache_path('nostr-index.sqlite'))
+    try:
+        asyncio.run(run_search(args, relays, index, health, log))
+    finally:
+        if index:
+            index.close()
+        health.close()
+
+def print_relay_stats(health, relays):
+    print(f"{'Relay':<45} {'Score':>7} {'Conn ms':>8} {'EOSE ms':>8} {'Fail':>5} {'Hits':>9}")
+    for relay in health.rank(relays):
+        stats = health.stats[normalize_relay_url(relay)]
+        if not (stats["connects"] or stats["connect_failures"]):
+            print(f"{relay:<45} {health.score(relay):7.3f} {'-':>8} {'-':>8} {'-':>5} {'-':>9}")
+            continue
+        failures = stats["connect_failures"] + stats["errors"]
+        print(f"{relay:<45} {health.score(relay):7.3f} {stats['connect_ms'] or 0:8.0f} {stats['eose_ms'] or 0:8.0f} "
+              f"{failures:5d} {stats['hits']:4d}/{stats['queries']:<4d}")
+
+async def run_search(args, relays, index, health, log):
+    if args.max_relays == "auto":
+        max_relays = health.auto_limit()
+    else:
+        max_relays = int(args.max_relays) if args.max_relays else None
+
+    with open(args.record, 'a') if args.record else contextlib.nullcontext() as record:
+        async with RelayPool(health=health, record=record) as pool:
+            if args.sync:
+                print(f"Syncing metadata from {len(relays)} relays into the local index...", file=log)
+                received = await sync_index(index, relays, args.verbose, pool)
+                print(f"Received {received} metadata events.", file=log)
+                if not args.identifier and not args.batch:
+                    return
+
+            if args.batch:
+                pubkeys = get_pubkeys_from_file(args.batch)
+                if not pubkeys:
+                    print("No public keys available to look up. Please check your input.", file=log)
+                    return
+                print(f"Looking up {len(pubkeys)} public keys across {len(relays)} relays...", file=log)
+                output = open(args.output, 'w') if args.output else sys.stdout
+                try:
+                    found = await batch_lookup(pubkeys, relays, output, args.verbose, pool,
+                                               chunk_size=args.chunk_size, timeout=args.timeout, index=index)
+                finally:
+                    if args.output:
+                        output.close()
+                print(f"\nFound metadata for {found} of {len(pubkeys)} public keys.", file=log)
+                return
+
+            print(f"Searching for user {args.identifier} across {len(relays)} relays...")
+            if index:
+                results = await indexed_search(args.identifier, relays, index, args.max_age * 3600, args.verbose,
+                                               offline=args.offline, first_hit=args.first_hit, deadline=args.timeout,
+                                               nip05_ttl=args.nip05_ttl * 3600, pool=pool, max_relays=max_relays)
+            else:
+                results = await search_identifier(args.identifier, relays, args.verbose, pool,
+                                                  first_hit=args.first_hit, deadline=args.timeout,
+                                                  max_relays=max_relays)
     
-    if result:
+    for result in results:
         print(f"\nUser found on {result['relay']}:")
         print(f"Public Key: {result['pubkey']}")
-        print(f"Name: {result['name']}")
-        print(f"Display Name: {result['display_name']}")
-        print(f"NIP-05: {result['nip05']}")
-    else:
-        print(f"\nUser {args.identifier} not found on any of the searched relays.")
+        print(f"Name: {result['name'] or 'Unknown'}")
+        print(f"Display Name: {result['display_name'] or 'Unknown'}")
+        print(f"NIP-05: {result['nip05'] or 'Unknown'}")
+    if not results:
+        where = "in the local index" if args.offline else "on any of the searched relays"
+        print(f"\nUser {args.identifier} not found {where}.")
 
 if __name__ == "__main__":
     main()
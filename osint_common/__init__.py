@@ -0,0 +1,33 @@
+"""
+Shared helpers for the Inforensics OSINT discovery scripts.
+Created by inforensics.ai
+
+The scripts live in their own directories and are run directly, so they add
+the repository root to sys.path before importing from this package.
+"""
+
+import importlib.util
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cache_path(filename):
+    """Return the path of a file in the shared cache directory.
+
+    The directory is $OSINT_CACHE_DIR if set, otherwise
+    ~/.cache/osint-user-discovery. It is created on first use.
+    """
+    directory = os.environ.get('OSINT_CACHE_DIR') or os.path.join(
+        os.path.expanduser('~'), '.cache', 'osint-user-discovery')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+
+def load_tool(name):
+    """Import one of the hyphen-named tool scripts, such as "mastodon-user-search", as a module."""
+    path = os.path.join(ROOT, name, f"{name}.py")
+    spec = importlib.util.spec_from_file_location(name.replace("-", "_"), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,299 @@
+"""
+Archive and cache service probing shared by cache-me-outside and
+tweet-cache-search.
+
+Every service is registered once as an Archive that knows how to build a
+query for each kind of target it supports ("url" for any web page,
+"twitter" for a Twitter username). ProbeEngine runs the registered
+services for a target concurrently over one pooled session, with per-host
+rate limits, timeouts and retries, and yields a ProbeResult per service as
+it completes.
+"""
+
+import concurrent.futures
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Optional
+from urllib.parse import quote_plus
+
+import requests
+
+from .httpcache import create_session
+from .ratelimit import HostScheduler
+
+# Cache links sit near the top of a results page; stop reading after this much
+SCAN_LIMIT = 256 * 1024
+CHUNK_SIZE = 16 * 1024
+
+WAYBACK_CDX = "https://web.archive.org/cdx/search/cdx"
+WAYBACK_FORMAT = "%Y%m%d%H%M%S"
+
+# Archive services rarely send caching headers; their answers change slowly
+DEFAULT_TTL = 6 * 3600
+
+
+@dataclass(slots=True)
+class ProbeResult:
+    service: str
+    status: str
+    url: Optional[str] = None
+    search_url: Optional[str] = None
+    note: Optional[str] = None
+    message: Optional[str] = None
+
+    @property
+    def ok(self):
+        return self.status == "success"
+
+
+@dataclass(slots=True)
+class CaptureSummary:
+    """Wayback Machine captures of one URL; error is set instead if the CDX query failed."""
+    url: str
+    captures: Optional[int] = None
+    first: Optional[str] = None
+    last: Optional[str] = None
+    closest: Optional[str] = None
+    closest_url: Optional[str] = None
+    truncated: Optional[bool] = None
+    error: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class Archive:
+    """A service that may hold cached or archived copies of a target.
+
+    queries maps each supported target kind to a function building the URL
+    to request. By default the service is checked with a bodiless probe of
+    that URL; link_patterns (per kind) instead stream the page and extract
+    the first cache link, and check replaces both with a custom
+    check(engine, query_url) returning a ProbeResult.
+    """
+    name: str
+    queries: dict
+    link_patterns: dict = field(default_factory=dict)
+    check: Optional[Callable] = None
+
+
+REGISTRY = []
+
+
+def register(archive):
+    REGISTRY.append(archive)
+    return archive
+
+
+def archives_for(kind):
+    """Return the registered archives that can be queried for a kind of target."""
+    return [archive for archive in REGISTRY if kind in archive.queries]
+
+
+def wayback_time(timestamp):
+    """Parse a (possibly truncated) Wayback timestamp such as 20240131 into epoch seconds."""
+    timestamp += "00000101000000"[len(timestamp):]
+    return datetime.strptime(timestamp, WAYBACK_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+
+
+class ProbeEngine:
+    """Run archive checks concurrently over a shared session and scheduler.
+
+    Each host is rate limited on its own (one request per second by
+    default), so services on different hosts never wait for each other.
+    With an httpcache.HTTPCache, responses are reused for ttl seconds
+    unless the service sends its own caching headers.
+    """
+
+    def __init__(self, scheduler=None, workers=16, timeout=10, cache=None, ttl=DEFAULT_TTL):
+        self.scheduler = scheduler or HostScheduler(rate=1.0, burst=1, max_retries=2)
+        self.workers = workers
+        self.timeout = timeout
+        self.session = create_session(pool_size=workers, cache=cache, ttl=ttl)
+
+    def request(self, method, url, **kwargs):
+        """Send a request through the scheduler and raise for error statuses."""
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.scheduler.request(self.session, method, url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def probe(self, url):
+        """Check that url answers with a success status without downloading its body.
+
+        A HEAD request is tried first; hosts that refuse HEAD get a GET for
+        the first byte only.
+        """
+        response = self.scheduler.request(self.session, "HEAD", url, timeout=self.timeout, allow_redirects=True)
+        if response.status_code in (405, 501):
+            response = self.scheduler.request(self.session, "GET", url, timeout=self.timeout, stream=True,
+                                              headers={"Range": "bytes=0-0"})
+            response.close()
+        response.raise_for_status()
+        return response
+
+    def scan(self, url, pattern, limit=SCAN_LIMIT, overlap=4096):
+        """Stream url and return the first match of the bytes pattern, or None.
+
+        The body is read in chunks and searched as it arrives, keeping the
+        last overlap bytes so matches that straddle a chunk boundary are
+        found. Reading stops at the first match or after limit bytes.
+        """
+        response = self.request("GET", url, stream=True)
+        buffer = b""
+        read = 0
+        try:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                read += len(chunk)
+                buffer = buffer[-overlap:] + chunk
+                match = pattern.search(buffer)
+                if match:
+                    return match
+                if read >= limit:
+                    break
+        finally:
+            response.close()
+        return None
+
+    def cdx_pages(self, params, resume_key=None):
+        """Page through a Wayback CDX query, yielding (rows, resume_key) per page.
+
+        params must ask for JSON output and a page size (limit). Rows come
+        without the header row, and resume_key is the key to continue after
+        this page, or None on the last one, so callers can checkpoint
+        between pages.
+        """
+        params = dict(params, output="json", showResumeKey="true")
+        while True:
+            if resume_key:
+                params["resumeKey"] = resume_key
+            response = self.request("GET", WAYBACK_CDX, params=params, timeout=30)
+            rows = response.json() if response.text.strip() else []
+            resume_key = None
+            if len(rows) >= 2 and rows[-2] == []:
+                resume_key = rows[-1][0]
+                rows = rows[:-2]
+            yield rows[1:], resume_key
+            if not resume_key:
+                return
+
+    def wayback_captures(self, url, timestamp=None, page_size=10000, max_pages=10):
+        """Summarise the Wayback Machine captures of url from the CDX API.
+
+        Only capture timestamps are requested and the summary is built
+        while paging, so memory does not grow with the number of captures.
+        If max_pages is reached the count is a lower bound and the last
+        capture is fetched separately. The closest capture is the one
+        nearest timestamp (default: now). Returns a CaptureSummary.
+        """
+        target = wayback_time(timestamp) if timestamp else time.time()
+        summary = CaptureSummary(url, captures=0)
+        best = None
+        pages = self.cdx_pages({"url": url, "fl": "timestamp", "limit": page_size})
+        for page, (rows, resume_key) in enumerate(pages, 1):
+            for row in rows:
+                captured = row[0]
+                summary.captures += 1
+                summary.first = summary.first or captured
+                summary.last = captured
+                distance = abs(wayback_time(captured) - target)
+                if best is None or distance < best:
+                    best, summary.closest = distance, captured
+            if resume_key and page >= max_pages:
+                summary.truncated = True
+                response = self.request("GET", WAYBACK_CDX, timeout=30,
+                                        params={"url": url, "fl": "timestamp", "output": "json", "limit": -1})
+                rows = response.json() if response.text.strip() else []
+                if len(rows) > 1:
+                    summary.last = rows[-1][0]
+                    if abs(wayback_time(rows[-1][0]) - target) < best:
+                        summary.closest = rows[-1][0]
+                break
+        if summary.closest:
+            summary.closest_url = f"https://web.archive.org/web/{summary.closest}/{url}"
+        return summary
+
+    def check(self, archive, kind, target):
+        """Run one archive against a target and describe the outcome."""
+        url = archive.queries[kind](target)
+        pattern = archive.link_patterns.get(kind)
+        try:
+            if archive.check:
+                return archive.check(self, url)
+            if pattern is None:
+                self.probe(url)
+                return ProbeResult(archive.name, "success", url=url)
+            match = self.scan(url, pattern)
+        except (requests.RequestException, ValueError) as e:
+            return ProbeResult(archive.name, "error", message=f"Error accessing {url}: {e}")
+        if match:
+            return ProbeResult(archive.name, "success", url=match.group(1).decode("utf-8", "replace"), search_url=url)
+        return ProbeResult(archive.name, "success", url=url, note="No cached version link found")
+
+    def run(self, kind, target, archives=None):
+        """Check target on every archive at once, yielding ProbeResults as they complete."""
+        archives = archives_for(kind) if archives is None else archives
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.workers, len(archives) or 1)) as executor:
+            futures = [executor.submit(self.check, archive, kind, target) for archive in archives]
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+
+
+def check_wayback(engine, url):
+    # Answering "is it archived?" takes only the first and the last capture,
+    # one row each; bulk summaries page through every capture instead
+    summary = engine.wayback_captures(url, page_size=1, max_pages=1)
+    if not summary.captures:
+        return ProbeResult("Wayback Machine", "error", message="No captures found")
+    note = f"first capture {summary.first}, last {summary.last}" if summary.truncated else f"1 capture, {summary.first}"
+    return ProbeResult("Wayback Machine", "success", url=summary.closest_url,
+                       search_url=f"https://web.archive.org/web/*/{url}", note=note)
+
+
+register(Archive(
+    "Wayback Machine",
+    {"url": lambda url: url,
+     "twitter": lambda username: f"https://twitter.com/{username}"},
+    check=check_wayback))
+
+register(Archive(
+    "Google Cache",
+    {"url": lambda url: f"https://webcache.googleusercontent.com/search?q=cache:{url}",
+     "twitter": lambda username: f"https://webcache.googleusercontent.com/search?q=cache:https://twitter.com/{username}"}))
+
+register(Archive(
+    "Ghost Archive",
+    {"url": lambda url: f"https://ghostarchive.org/search?term={quote_plus(url)}",
+     "twitter": lambda username: f"https://ghostarchive.org/search?term={quote_plus(username)}"}))
+
+register(Archive(
+    "Bing",
+    {"url": lambda url: f"https://www.bing.com/search?q=url:{quote_plus(url)}",
+     "twitter": lambda username: f"https://www.bing.com/search?q=site:twitter.com+{quote_plus(username)}"},
+    link_patterns={"url": re.compile(rb'<a href="(https://cc\.bingj\.com/cache\.aspx[^"]+)"[^>]*>Cached<')}))
+
+register(Archive(
+    "Yandex",
+    {"url": lambda url: f"https://yandex.com/search/?text=url:{quote_plus(url)}",
+     "twitter": lambda username: f"https://yandex.com/search/?text=site:twitter.com+{quote_plus(username)}"},
+    link_patterns={"url": re.compile(rb'<a href="(https://yandexwebcache\.net[^"]+)"[^>]*>Cached<')}))
+
+register(Archive(
+    "Baidu",
+    {"url": lambda url: f"https://www.baidu.com/s?wd=url:{quote_plus(url)}",
+     "twitter": lambda username: f"https://www.baidu.com/s?wd=site:twitter.com+{quote_plus(username)}"}))
+
+register(Archive(
+    "Internet Archive",
+    {"url": lambda url: f"https://archive.org/search.php?query={quote_plus(url)}",
+     "twitter": lambda username: f"https://archive.org/search.php?query=twitter.com%2F{username}"}))
+
+register(Archive(
+    "Archive.today",
+    {"url": lambda url: f"https://archive.today/{url}",
+     "twitter": lambda username: f"https://archive.today/https://twitter.com/{username}"}))
+
+register(Archive(
+    "WebCite",
+    {"url": lambda url: f"http://webcitation.org/query?url={url}",
+     "twitter": lambda username: f"http://webcitation.org/query?url=https://twitter.com/{username}"}))
@@ -0,0 +1,272 @@
+"""
+Persistent HTTP cache shared by all the scripts.
+
+Responses are stored in SQLite, keyed by method and URL. Their freshness
+follows Cache-Control and Expires; stale entries with an ETag or
+Last-Modified are revalidated with a conditional request instead of being
+downloaded again. Each tool passes a TTL used for responses that carry no
+caching headers at all, and the cache evicts the least recently used
+entries once it outgrows its size limit.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from . import cache_path
+
+CACHEABLE_STATUSES = {200, 203, 204, 300, 301, 308, 404, 405, 410, 501}
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def _parse_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _cache_control(headers):
+    directives = {}
+    for part in headers.get('Cache-Control', '').split(','):
+        name, _, value = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"')
+    return directives
+
+
+def freshness(headers, now, default_ttl=0):
+    """Return how many seconds a response stays fresh, or None if it must not be stored.
+
+    default_ttl applies only when the response has neither Cache-Control
+    lifetime nor Expires.
+    """
+    directives = _cache_control(headers)
+    if 'no-store' in directives:
+        return None
+    if 'no-cache' in directives:
+        return 0
+    for name in ('s-maxage', 'max-age'):
+        if name in directives:
+            try:
+                return max(0, int(directives[name]))
+            except ValueError:
+                return 0
+    if 'Expires' in headers:
+        expires = _parse_date(headers['Expires'])
+        if expires is None:
+            return 0
+        date = _parse_date(headers.get('Date')) or now
+        return max(0, expires - date)
+    return default_ttl
+
+
+class HTTPCache:
+    """SQLite store of HTTP responses with size-bounded LRU eviction.
+
+    The connection is shared by all threads of a process; several
+    processes may use the same file.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                status INTEGER NOT NULL,
+                reason TEXT,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_lru ON responses (accessed_at);
+        """)
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """Return (status, reason, headers, body, expires_at) for key, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status, reason, headers, body, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        status, reason, headers, body, expires_at = row
+        return status, reason, CaseInsensitiveDict(json.loads(headers)), body, expires_at
+
+    def put(self, key, status, reason, headers, body, expires_at):
+        size = len(body) + len(key) + 256
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              (key, status, reason, json.dumps(dict(headers)), body, expires_at, time.time(), size))
+            self.size += size - (old[0] if old else 0)
+            if self.size > self.max_bytes:
+                self._evict(self.max_bytes * 0.9)
+            self.conn.commit()
+
+    def refresh(self, key, headers, expires_at):
+        """Record a successful revalidation: merge the new headers and extend freshness."""
+        with self.lock:
+            row = self.conn.execute("SELECT headers FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return
+            merged = CaseInsensitiveDict(json.loads(row[0]))
+            merged.update(headers)
+            self.conn.execute("UPDATE responses SET headers = ?, expires_at = ?, accessed_at = ? WHERE key = ?",
+                              (json.dumps(dict(merged)), expires_at, time.time(), key))
+            self.conn.commit()
+
+    def _evict(self, target):
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        for key, size in rows:
+            if self.size <= target:
+                break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.size -= size
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+def shared_cache():
+    """Open the cache file shared by every tool, or return None if disabled.
+
+    $OSINT_HTTP_CACHE_MB sets the size limit and OSINT_HTTP_CACHE=0
+    disables caching altogether.
+    """
+    if os.environ.get('OSINT_HTTP_CACHE', '1') == '0':
+        return None
+    max_bytes = int(float(os.environ.get('OSINT_HTTP_CACHE_MB', DEFAULT_MAX_BYTES / 1024 / 1024)) * 1024 * 1024)
+    return HTTPCache(cache_path('http-cache.sqlite'), max_bytes=max_bytes)
+
+
+class CachedSession(requests.Session):
+    """A requests session that answers GET and HEAD requests from an HTTPCache.
+
+    Fresh entries are returned without touching the network; stale ones
+    with validators are revalidated with If-None-Match/If-Modified-Since.
+    ttl is the lifetime given to responses without caching headers.
+    Streamed requests always go to the network, since their bodies are
+    usually read only in part. Responses served from the cache have
+    from_cache set.
+    """
+
+    def __init__(self, cache, ttl=0):
+        super().__init__()
+        self.cache = cache
+        self.ttl = ttl
+
+    def _key(self, method, url, kwargs):
+        prepared = requests.Request(method.upper(), url, params=kwargs.get('params')).prepare()
+        key = f"{prepared.method} {prepared.url}"
+        # Responses differ by credentials; keep a digest of them, never the secret itself
+        authorization = CaseInsensitiveDict(kwargs.get('headers') or {}).get('Authorization') \
+            or self.headers.get('Authorization')
+        if authorization:
+            key += " " + hashlib.sha256(authorization.encode()).hexdigest()[:16]
+        return key
+
+    def _cacheable(self, method, kwargs):
+        return self.cache is not None and method.upper() in ('GET', 'HEAD') and not kwargs.get('stream')
+
+    def _build(self, key, entry):
+        status, reason, headers, body, _ = entry
+        response = requests.Response()
+        response.status_code = status
+        response.reason = reason
+        response.headers = headers
+        response._content = body
+        response._content_consumed = True
+        response.url = key.split(' ')[1]
+        response.encoding = requests.utils.get_encoding_from_headers(headers)
+        response.from_cache = True
+        return response
+
+    def fresh_response(self, method, url, **kwargs):
+        """Return the cached response if it is still fresh, without any network access."""
+        if not self._cacheable(method, kwargs):
+            return None
+        key = self._key(method, url, kwargs)
+        entry = self.cache.get(key)
+        if entry is None or entry[4] <= time.time():
+            return None
+        return self._build(key, entry)
+
+    def request(self, method, url, **kwargs):
+        if not self._cacheable(method, kwargs):
+            return super().request(method, url, **kwargs)
+        key = self._key(method, url, kwargs)
+        entry = self.cache.get(key)
+        now = time.time()
+        if entry is not None and entry[4] > now:
+            return self._build(key, entry)
+
+        if entry is not None:
+            cached_headers = entry[2]
+            conditional = dict(kwargs.get('headers') or {})
+            if 'ETag' in cached_headers:
+                conditional['If-None-Match'] = cached_headers['ETag']
+            if 'Last-Modified' in cached_headers:
+                conditional['If-Modified-Since'] = cached_headers['Last-Modified']
+            if len(conditional) > len(kwargs.get('headers') or {}):
+                kwargs['headers'] = conditional
+
+        response = super().request(method, url, **kwargs)
+        response.from_cache = False
+        if response.status_code == 304 and entry is not None:
+            lifetime = freshness(response.headers, now, self.ttl)
+            self.cache.refresh(key, response.headers, now + (lifetime or 0))
+            refreshed = self.cache.get(key)
+            if refreshed is None:
+                # Evicted since it was read; the 304 still vouches for the body we hold
+                status, reason, headers, body, _ = entry
+                headers = CaseInsensitiveDict(headers)
+                headers.update(response.headers)
+                refreshed = (status, reason, headers, body, now + (lifetime or 0))
+            cached = self._build(key, refreshed)
+            cached.elapsed = response.elapsed
+            return cached
+        if response.status_code in CACHEABLE_STATUSES:
+            lifetime = freshness(response.headers, now, self.ttl)
+            validators = 'ETag' in response.headers or 'Last-Modified' in response.headers
+            if lifetime is not None and (lifetime > 0 or validators):
+                self.cache.put(key, response.status_code, response.reason, response.headers,
+                               response.content, now + lifetime)
+        return response
+
+
+def create_session(pool_size=10, cache=None, ttl=0, hosts=None):
+    """Return a session whose connection pool is shared by all workers.
+
+    pool_size is the number of connections kept per host. urllib3 keeps
+    pools for at most max(pool_size, hosts) hosts and drops the least
+    recently used beyond that, so callers cycling through many hosts pass
+    their number to keep connections alive until a host comes round again.
+    With a cache the session is a CachedSession using ttl for responses
+    without caching headers.
+    """
+    session = CachedSession(cache, ttl) if cache is not None else requests.Session()
+    adapter = HTTPAdapter(pool_connections=max(pool_size, hosts or 0), pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
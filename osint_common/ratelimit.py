@@ -0,0 +1,334 @@
+"""
+Per-host request scheduling with token buckets.
+
+Every host gets its own bucket, so a slow or rate-limited host never delays
+requests to other hosts. Buckets adapt to the X-RateLimit-Remaining and
+X-RateLimit-Reset headers sent by Mastodon, honour Retry-After, and failed
+requests are retried with jittered exponential backoff.
+"""
+
+import heapq
+import random
+import threading
+import time
+import concurrent.futures
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RetryLater(Exception):
+    """Raised inside HostScheduler.map tasks when a host asks us to wait."""
+
+    def __init__(self, delay):
+        super().__init__(f"host busy, retry in {delay:.1f}s")
+        self.delay = delay
+
+
+def host_of(url):
+    return urlparse(url).netloc.lower()
+
+
+def _parse_retry_after(value, now):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - now)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_reset(value, now):
+    """Return seconds until X-RateLimit-Reset, which may be ISO 8601, epoch or a delta."""
+    if not value:
+        return None
+    try:
+        number = float(value)
+        return max(0.0, number - now if number > 1e9 else number)
+    except ValueError:
+        pass
+    try:
+        reset = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if reset.tzinfo is None:
+            reset = reset.replace(tzinfo=timezone.utc)
+        return max(0.0, reset.timestamp() - now)
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_at(self, now):
+        with self.lock:
+            self._refill(now)
+            at = now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+            return max(at, self.blocked_until)
+
+    def reserve(self, now, max_wait=None):
+        """Take a token and return how long the caller must wait before using it.
+
+        If the wait would exceed max_wait, no token is taken and the wait
+        is returned all the same, so callers that give up lose nothing.
+        """
+        with self.lock:
+            self._refill(now)
+            tokens = self.tokens - 1
+            wait = max(0.0 if tokens >= 0 else -tokens / self.rate, self.blocked_until - now)
+            if max_wait is None or wait <= max_wait:
+                self.tokens = tokens
+            return wait
+
+    def block(self, until):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, until)
+
+
+class HostBreaker:
+    """Skip hosts that keep failing at the transport level.
+
+    After threshold consecutive connection errors or timeouts a host is
+    skipped for cooldown seconds. The first request after that is a trial:
+    a success closes the breaker, another failure opens it again.
+    """
+
+    def __init__(self, threshold=3, cooldown=300.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = {}
+        self.open_until = {}
+        self.lock = threading.Lock()
+
+    def allow(self, host):
+        with self.lock:
+            return time.monotonic() >= self.open_until.get(host, 0.0)
+
+    def success(self, host):
+        with self.lock:
+            self.failures.pop(host, None)
+            self.open_until.pop(host, None)
+
+    def failure(self, host):
+        with self.lock:
+            count = self.failures.get(host, 0) + 1
+            self.failures[host] = count
+            if count >= self.threshold:
+                self.open_until[host] = time.monotonic() + self.cooldown
+
+
+class HostScheduler:
+    """Rate limit and retry HTTP requests independently for each host.
+
+    rate and burst set the default bucket for hosts that do not advertise
+    their own limits. request() is a drop-in for session.request() that
+    waits for the host's bucket; map() runs many tasks over a thread pool
+    and dispatches each one only when its host is ready, so workers are
+    never parked on a host that is backing off.
+    """
+
+    def __init__(self, rate=1.0, burst=5, max_retries=3, backoff=1.0, max_backoff=60.0):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def bucket(self, host):
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def ready_at(self, host, now=None):
+        return self.bucket(host).ready_at(time.monotonic() if now is None else now)
+
+    def acquire(self, host):
+        # Deferred tasks give up without taking a token, which the next
+        # ready task can use instead
+        deferrable = getattr(self._local, 'deferrable', False)
+        wait = self.bucket(host).reserve(time.monotonic(), self.backoff if deferrable else None)
+        if wait > 0:
+            if deferrable and wait > self.backoff:
+                raise RetryLater(wait)
+            time.sleep(wait)
+
+    def backoff_delay(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def update(self, host, response):
+        """Adjust the host's bucket from the rate-limit headers of a response."""
+        bucket = self.bucket(host)
+        now = time.time()
+        headers = response.headers
+        retry_after = _parse_retry_after(headers.get('Retry-After'), now)
+        if retry_after is not None and response.status_code in RETRY_STATUSES:
+            bucket.block(time.monotonic() + retry_after)
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_in = _parse_reset(headers.get('X-RateLimit-Reset'), now)
+        if remaining is None or reset_in is None:
+            return
+        try:
+            remaining = int(float(remaining))
+        except ValueError:
+            return
+        if remaining <= 0:
+            bucket.block(time.monotonic() + reset_in)
+        else:
+            with bucket.lock:
+                bucket.rate = max(remaining / max(reset_in, 1.0), 1.0 / self.max_backoff)
+
+    def request(self, session, method, url, **kwargs):
+        """Send a request through session, honouring the host's limits.
+
+        Connection errors and retryable statuses are retried up to
+        max_retries times. The last response is returned even if it is an
+        error status; the last exception is re-raised if every attempt failed.
+        """
+        # Sessions backed by a local cache (httpcache.CachedSession) answer
+        # fresh hits without using up the host's rate limit
+        fresh_response = getattr(session, 'fresh_response', None)
+        if fresh_response is not None:
+            response = fresh_response(method, url, **kwargs)
+            if response is not None:
+                return response
+        host = host_of(url)
+        deferrable = getattr(self._local, 'deferrable', False)
+        for attempt in range(self.max_retries + 1):
+            self.acquire(host)
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff_delay(attempt))
+                continue
+            self.update(host, response)
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            delay = _parse_retry_after(response.headers.get('Retry-After'), time.time())
+            if delay is None:
+                delay = self.backoff_delay(attempt)
+            self.bucket(host).block(time.monotonic() + delay)
+            if deferrable:
+                raise RetryLater(delay)
+        return response
+
+    def _run_deferrable(self, fn, item, deferrable):
+        self._local.deferrable = deferrable
+        try:
+            return fn(item)
+        finally:
+            self._local.deferrable = False
+
+    def map(self, fn, items, key, workers=10, per_host=1, max_pending=None):
+        """Run fn over items concurrently, scheduling by host.
+
+        key(item) returns the host an item talks to. Items are read lazily,
+        at most max_pending are queued at once, and (item, result) pairs are
+        yielded as they complete. A task whose host asks us to back off is
+        put back in its host's queue instead of sleeping in a worker.
+        """
+        max_pending = max_pending or workers * 20
+        items = iter(items)
+        exhausted = False
+        queues = {}
+        active = {}
+        deferrals = {}
+        ready = []
+        scheduled = set()
+        queued = 0
+        seq = 0
+
+        def schedule(host):
+            nonlocal seq
+            if host in scheduled or not queues.get(host) or active.get(host, 0) >= per_host:
+                return
+            seq += 1
+            heapq.heappush(ready, (self.ready_at(host), seq, host))
+            scheduled.add(host)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            running = {}
+            while True:
+                while not exhausted and queued < max_pending:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    host = key(item)
+                    queues.setdefault(host, deque()).append(item)
+                    queued += 1
+                    schedule(host)
+
+                now = time.monotonic()
+                while ready and ready[0][0] <= now and len(running) < workers:
+                    _, _, host = heapq.heappop(ready)
+                    scheduled.discard(host)
+                    at = self.ready_at(host, now)
+                    if at > now:
+                        seq += 1
+                        heapq.heappush(ready, (at, seq, host))
+                        scheduled.add(host)
+                        continue
+                    item = queues[host].popleft()
+                    queued -= 1
+                    active[host] = active.get(host, 0) + 1
+                    deferrable = deferrals.get(id(item), 0) < self.max_retries
+                    future = executor.submit(self._run_deferrable, fn, item, deferrable)
+                    running[future] = (host, item)
+                    schedule(host)
+
+                if not running and not ready:
+                    if exhausted and not queued:
+                        break
+                    continue
+
+                timeout = max(0.0, ready[0][0] - now) if ready else None
+                if not running:
+                    time.sleep(timeout)
+                    continue
+                if len(running) >= workers:
+                    timeout = None
+                done, _ = concurrent.futures.wait(running, timeout=timeout,
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    host, item = running.pop(future)
+                    active[host] -= 1
+                    try:
+                        result = future.result()
+                    except RetryLater:
+                        deferrals[id(item)] = deferrals.get(id(item), 0) + 1
+                        queues[host].appendleft(item)
+                        queued += 1
+                        schedule(host)
+                        continue
+                    deferrals.pop(id(item), None)
+                    if not queues[host] and not active[host]:
+                        del queues[host], active[host]
+                    else:
+                        schedule(host)
+                    yield item, result
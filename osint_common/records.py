@@ -0,0 +1,112 @@
+"""
+Compact result records shared by all the scripts.
+
+Results are slotted dataclasses that hold only the fields the scripts
+report, and every record is serialised by the same encoder: orjson when it
+is installed, the json module otherwise. Large values such as robots.txt
+bodies or zone transfer dumps are written once to a content-addressed
+BlobStore, and the record keeps only a small Blob reference.
+"""
+
+import dataclasses
+import hashlib
+import json
+import os
+import tempfile
+
+# Optional fast encoder; the standard json module is used without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Values longer than this (in characters or bytes) are spilled to disk
+INLINE_LIMIT = 4096
+
+
+def as_dict(record):
+    """Return the fields of a record as a dict, leaving out those that are None."""
+    values = {}
+    for field in dataclasses.fields(record):
+        value = getattr(record, field.name)
+        if value is not None:
+            values[field.name] = value
+    return values
+
+
+def _default(value):
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return as_dict(value)
+    return str(value)
+
+
+def dumps(value, indent=False):
+    """Serialise a record, or any JSON value containing records, to a str.
+
+    Record fields that are None are left out. Values JSON cannot represent,
+    such as datetimes, are written as their str(). Without indent the
+    output is compact and on a single line, ready for JSONL files.
+    """
+    if orjson is not None:
+        option = orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(value, default=_default, option=option).decode()
+        except TypeError:
+            # orjson rejects integers wider than 64 bits; json does not
+            pass
+    if indent:
+        return json.dumps(value, default=_default, ensure_ascii=False, indent=2)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":"))
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Blob:
+    """A value stored in a BlobStore, identified by the SHA-256 of its content."""
+    sha256: str
+    size: int
+    path: str
+
+    def __str__(self):
+        return f"{self.path} ({self.size} bytes)"
+
+
+class BlobStore:
+    """Content-addressed files for values too large to keep in records.
+
+    A value is stored at DIRECTORY/ab/abcd... after the hex SHA-256 of its
+    content, so identical bodies seen for many targets take one file and
+    are written once. Files are written to a temporary name and renamed,
+    so a file under its final name is always complete.
+    """
+
+    def __init__(self, directory, inline_limit=INLINE_LIMIT):
+        self.directory = directory
+        self.inline_limit = inline_limit
+        os.makedirs(directory, exist_ok=True)
+
+    def put(self, data):
+        """Store str (as UTF-8) or bytes and return its Blob."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        folder = os.path.join(self.directory, digest[:2])
+        path = os.path.join(folder, digest)
+        if not os.path.exists(path):
+            os.makedirs(folder, exist_ok=True)
+            fd, temporary = tempfile.mkstemp(dir=folder)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(temporary, path)
+            except BaseException:
+                os.unlink(temporary)
+                raise
+        return Blob(digest, len(data), path)
+
+    def spill(self, value):
+        """Return a Blob for a str or bytes value longer than inline_limit, else value itself."""
+        if isinstance(value, (str, bytes)) and len(value) > self.inline_limit:
+            return self.put(value)
+        return value
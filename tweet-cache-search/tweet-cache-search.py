@@ -1,103 +1,199 @@
 #!/usr/bin/env python3
 
-import requests
-from urllib.parse import quote_plus
+"""
+tweet-cache-search.py - Search for cached tweets across various services.
+Made by inforensics.ai
+
+The services are defined once in osint_common.archives and shared with
+cache-me-outside; all of them are queried at the same time.
+
+With --enumerate it instead lists every tweet of the user captured by the
+Wayback Machine, paging through the CDX API and streaming one JSON line per
+tweet. Progress is checkpointed in SQLite so an interrupted run resumes
+where it stopped.
+"""
+
 import argparse
+import os
+import re
+import sqlite3
+import sys
 import webbrowser
 
-def safe_request(url):
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        return response
-    except requests.RequestException as e:
-        return f"Error accessing {url}: {str(e)}"
-
-def search_wayback_machine(username):
-    url = f"https://web.archive.org/web/*/https://twitter.com/{username}"
-    result = safe_request(url)
-    if isinstance(result, requests.Response) and result.status_code == 200:
-        return f"Wayback Machine results: {url}"
-    return f"No results found on Wayback Machine: {result}"
-
-def search_google_cache(username):
-    url = f"https://webcache.googleusercontent.com/search?q=cache:https://twitter.com/{username}"
-    result = safe_request(url)
-    if isinstance(result, requests.Response) and result.status_code == 200:
-        return f"Google Cache results: {url}"
-    return f"No results found on Google Cache: {result}"
-
-def search_ghost_archive(username):
-    url = f"https://ghostarchive.org/search?term={username}"
-    result = safe_request(url)
-    if isinstance(result, requests.Response) and result.status_code == 200:
-        return f"Ghost Archive results: {url}"
-    return f"No results found on Ghost Archive: {result}"
-
-def search_bing(username):
-    url = f"https://www.bing.com/search?q=site:twitter.com+{quote_plus(username)}"
-    result = safe_request(url)
-    if isinstance(result, requests.Response) and result.status_code == 200:
-        return f"Bing search results: {url}"
-    return f"No results found on Bing: {result}"
-
-def search_yandex(username):
-    url = f"https://yandex.com/search/?text=site:twitter.com+{quote_plus(username)}"
-    result = safe_request(url)
-    if isinstance(result, requests.Response) and result.status_code == 200:
-        return f"Yandex search results: {url}"
-    return f"No results found on Yandex: {result}"
-
-def search_baidu(username):
-    url = f"https://www.baidu.com/s?wd=site:twitter.com+{quote_plus(username)}"
-    result = safe_request(url)
-    if isinstance(result, requests.Response) and result.status_code == 200:
-        return f"Baidu search results: {url}"
-    return f"No results found on Baidu: {result}"
-
-def search_internet_archive(username):
-    url = f"https://archive.org/search.php?query=twitter.com%2F{username}"
-    result = safe_request(url)
-    if isinstance(result, requests.Response) and result.status_code == 200:
-        return f"Internet Archive search results: {url}"
-    return f"No results found on Internet Archive: {result}"
-
-def search_webcite(username):
-    url = f"http://webcitation.org/query?url=https://twitter.com/{username}"
-    result = safe_request(url)
-    if isinstance(result, requests.Response) and result.status_code == 200:
-        return f"WebCite results: {url}"
-    return f"No results found on WebCite: {result}"
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from osint_common import cache_path
+from osint_common.archives import ProbeEngine
+from osint_common.httpcache import shared_cache
+from osint_common.records import dumps
+
+TWEET_DOMAINS = ("twitter.com", "x.com")
+STATUS_PATTERN = re.compile(r"/status(?:es)?/(\d+)")
+
+class Checkpoint:
+    """SQLite record of an enumeration: the CDX resume key per domain, the
+    tweet IDs already written, and the output file with how far it is valid.
+
+    The resume key, the new IDs and the output offset of a page are
+    committed together, so after a crash the output is truncated back to
+    the last committed page and enumeration continues from there. A
+    checkpoint belongs to one output file, since the IDs it has seen are
+    only in that file.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS progress (
+                domain TEXT PRIMARY KEY,
+                resume_key TEXT,
+                done INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS output (path TEXT PRIMARY KEY, offset INTEGER NOT NULL);
+        """)
+
+    def progress(self, domain):
+        row = self.conn.execute("SELECT resume_key, done FROM progress WHERE domain = ?", (domain,)).fetchone()
+        return (row[0], bool(row[1])) if row else (None, False)
+
+    def output_path(self):
+        """Return the output file this checkpoint belongs to, or None for a new checkpoint."""
+        row = self.conn.execute("SELECT path FROM output").fetchone()
+        return row[0] if row else None
+
+    def claim(self, path):
+        """Tie a new checkpoint to its output file, which starts out empty."""
+        self.conn.execute("INSERT INTO output VALUES (?, 0)", (path,))
+        self.conn.commit()
+
+    def offset(self, path):
+        row = self.conn.execute("SELECT offset FROM output WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else 0
+
+    def new_ids(self, ids):
+        """Return the IDs that have not been written yet and mark them as seen."""
+        fresh = []
+        for tweet_id in ids:
+            if self.conn.execute("INSERT OR IGNORE INTO seen VALUES (?)", (tweet_id,)).rowcount:
+                fresh.append(tweet_id)
+        return fresh
+
+    def commit_page(self, domain, resume_key, path, offset):
+        self.conn.execute("INSERT OR REPLACE INTO progress VALUES (?, ?, ?)", (domain, resume_key, int(not resume_key)))
+        self.conn.execute("INSERT OR REPLACE INTO output VALUES (?, ?)", (path, offset))
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+def enumerate_tweets(engine, username, output_path, checkpoint, page_size=5000, verbose=False):
+    """Write one JSON line per archived tweet of username to output_path.
+
+    The CDX API is asked for status URLs under every domain in
+    TWEET_DOMAINS, collapsed to one row per archived URL, one page at a
+    time. URL variants of the same tweet (query strings, /photo/1, both
+    domains) are merged by tweet ID through the checkpoint's seen table, so
+    memory use is one page regardless of how many captures the account has.
+    Returns the number of tweets written in this run.
+    """
+    written = 0
+    with open(output_path, "a+b") as output:
+        # Drop anything written after the last committed page
+        output.truncate(checkpoint.offset(output_path))
+        output.seek(0, os.SEEK_END)
+        for domain in TWEET_DOMAINS:
+            resume_key, done = checkpoint.progress(domain)
+            if done:
+                continue
+            params = {"url": f"{domain}/{username}/status/", "matchType": "prefix",
+                      "fl": "original,timestamp", "collapse": "urlkey", "limit": page_size}
+            for rows, resume_key in engine.cdx_pages(params, resume_key):
+                first_capture = {}
+                for original, timestamp in rows:
+                    match = STATUS_PATTERN.search(original)
+                    if match and match.group(1) not in first_capture:
+                        first_capture[match.group(1)] = (original, timestamp)
+                lines = []
+                for tweet_id in checkpoint.new_ids(first_capture):
+                    original, timestamp = first_capture[tweet_id]
+                    lines.append(dumps({
+                        "id": tweet_id,
+                        "url": f"https://twitter.com/{username}/status/{tweet_id}",
+                        "archived_url": original,
+                        "timestamp": timestamp,
+                        "snapshot": f"https://web.archive.org/web/{timestamp}/{original}",
+                    }) + "\n")
+                output.write("".join(lines).encode())
+                output.flush()
+                os.fsync(output.fileno())
+                checkpoint.commit_page(domain, resume_key, output_path, output.tell())
+                written += len(lines)
+                if verbose:
+                    print(f"{domain}: {len(rows)} archived URLs, {len(lines)} new tweets", file=sys.stderr)
+    return written
+
+def print_result(result, open_browser=False):
+    if result.ok:
+        print(f"{result.service} results: {result.url}")
+        if result.note:
+            print(f"  Note: {result.note}")
+        if open_browser:
+            webbrowser.open(result.url)
+    else:
+        print(f"No results found on {result.service}: {result.message}")
+    print("-" * 50)
 
 def main():
     parser = argparse.ArgumentParser(description="Search for cached tweets across various services.")
     parser.add_argument("-u", "--username", help="Twitter username to search for")
     parser.add_argument("-o", "--open", action="store_true", help="Open results in default web browser")
+    parser.add_argument("-e", "--enumerate", action="store_true", help="List every tweet of the user archived by the Wayback Machine (JSONL)")
+    parser.add_argument("--output", metavar="FILE", help="Enumeration output file (default: USERNAME-tweets.jsonl)")
+    parser.add_argument("--checkpoint", metavar="FILE", help="Enumeration checkpoint database (default: in the cache directory)")
+    parser.add_argument("--overwrite", action="store_true", help="Let a new enumeration replace an existing output file")
+    parser.add_argument("--page-size", type=int, default=5000, help="Archived URLs per CDX page when enumerating (default: 5000)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Report enumeration progress")
+    parser.add_argument("--no-http-cache", action="store_true", help="Do not read or write the shared HTTP response cache")
     args = parser.parse_args()
 
     if args.username:
         username = args.username
     else:
         username = input("Enter the Twitter username to search for: ")
+    username = username.lstrip("@")
+    http_cache = None if args.no_http_cache else shared_cache()
+
+    if args.enumerate:
+        output_path = os.path.abspath(args.output or f"{username}-tweets.jsonl")
+        checkpoint = Checkpoint(args.checkpoint or cache_path(f"tweet-enumeration-{username.lower()}.sqlite"))
+        known = checkpoint.output_path()
+        if known is None:
+            if os.path.exists(output_path) and os.path.getsize(output_path) and not args.overwrite:
+                checkpoint.close()
+                sys.exit(f"{output_path} already exists; pass --overwrite to replace it")
+            checkpoint.claim(output_path)
+        elif known != output_path:
+            checkpoint.close()
+            sys.exit(f"The checkpoint belongs to {known}; use --output {known} to resume, "
+                     f"or a new --checkpoint to start over")
+        try:
+            written = enumerate_tweets(ProbeEngine(cache=http_cache), username, output_path, checkpoint,
+                                       page_size=args.page_size, verbose=args.verbose)
+        except (requests.RequestException, ValueError, KeyboardInterrupt) as e:
+            checkpoint.rollback()
+            sys.exit(f"Enumeration stopped, run again to resume: {e}")
+        finally:
+            checkpoint.close()
+        print(f"{written} archived tweets written to {output_path}", file=sys.stderr)
+        return
 
-    services = [
-        search_wayback_machine,
-        search_google_cache,
-        search_ghost_archive,
-        search_bing,
-        search_yandex,
-        search_baidu,
-        search_internet_archive,
-        search_webcite
-    ]
-
-    for service in services:
-        result = service(username)
-        print(result)
-        if args.open and "results:" in result:
-            url = result.split(": ")[1]
-            webbrowser.open(url)
-        print("-" * 50)
+    for result in ProbeEngine(cache=http_cache).run("twitter", username):
+        print_result(result, args.open)
 
 if __name__ == "__main__":
     main()
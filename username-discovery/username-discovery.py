@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Username Discovery Script
+Created by inforensics.ai
+
+Profiles one handle across every source at once: Mastodon instances,
+Nostr relays and tweet archives. All three run in a single event loop
+under one global concurrency limit, so the total time is that of the
+slowest source rather than the sum. Mastodon and archive checks reuse the
+blocking code of mastodon-user-search.py and osint_common.archives on a
+thread pool; Nostr relays are queried natively over one relay pool.
+Results stream as they arrive, in one record format for every source.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from osint_common import cache_path, load_tool
+from osint_common.archives import DEFAULT_TTL as ARCHIVE_TTL, ProbeEngine, archives_for
+from osint_common.httpcache import create_session, shared_cache
+from osint_common.records import dumps
+
+SOURCES = ("mastodon", "nostr", "archives")
+
+@dataclass(slots=True)
+class Record:
+    """One result, in the same format for every source; unset fields are not written."""
+    handle: str
+    source: str
+    service: str
+    found: bool
+    url: Optional[str] = None
+    name: Optional[str] = None
+    error: Optional[str] = None
+
+class Discovery:
+    """Run every source for one handle, emitting each record as soon as it is known."""
+
+    def __init__(self, handle, limit, emit, verbose=False):
+        self.handle = handle
+        # Mastodon and Twitter only know the local part of name@domain
+        self.username = handle.split("@")[0]
+        self.limit = asyncio.Semaphore(limit)
+        self.emit = emit
+        self.verbose = verbose
+
+    async def blocking(self, fn, *args):
+        """Run a blocking call on the shared thread pool within the global limit."""
+        async with self.limit:
+            return await asyncio.to_thread(fn, *args)
+
+    async def mastodon(self, mastodon, instances, session, cache, instances_session=None):
+        if instances is None:
+            instances = await self.blocking(functools.partial(mastodon.get_instances_from_api,
+                                                              session=instances_session))
+        if not instances:
+            self.emit(Record(self.handle, "mastodon", "mastodon", False, error="no instances to search"))
+            return
+        no_webfinger = set()
+
+        async def check(instance):
+            result = await self.blocking(mastodon.check_user, instance, self.username, session, no_webfinger, cache)
+            self.emit(Record(self.handle, "mastodon", instance, result.found, result.url,
+                             result.display_name, result.error))
+
+        await asyncio.gather(*(check(instance) for instance in instances))
+
+    async def nostr(self, nostr, relays, pool, timeout):
+        identifier = self.handle
+        resolved = await nostr.resolve_nip05(self.handle, verbose=self.verbose)
+        if resolved is not None:
+            if resolved[0] is None:
+                self.emit(Record(self.handle, "nostr", "nip05", False))
+                return
+            identifier, hints = resolved
+            relays = list(dict.fromkeys(hints + list(relays)))
+        filters = [nostr.build_filter(identifier)]
+        seen = set()
+
+        async def query(relay):
+            async with self.limit:
+                async for profile in nostr.fetch_profiles(relay, filters, self.verbose, pool, timeout=timeout):
+                    if profile["pubkey"] not in seen:
+                        seen.add(profile["pubkey"])
+                        self.emit(Record(self.handle, "nostr", relay, True, f"nostr:{profile['pubkey']}", profile["name"]))
+
+        await asyncio.gather(*(query(relay) for relay in relays))
+        if not seen:
+            self.emit(Record(self.handle, "nostr", "relays", False))
+
+    async def archives(self, engine):
+        async def check(archive):
+            result = await self.blocking(engine.check, archive, "twitter", self.username)
+            self.emit(Record(self.handle, "archives", result.service, result.ok,
+                             result.url, error=result.message))
+
+        await asyncio.gather(*(check(archive) for archive in archives_for("twitter")))
+
+async def discover(handle, args, emit, http_cache):
+    """Run the selected sources concurrently in this event loop."""
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=args.limit))
+    discovery = Discovery(handle, args.limit, emit, args.verbose)
+    tasks = []
+    with contextlib.ExitStack() as cleanup:
+        async with contextlib.AsyncExitStack() as async_cleanup:
+            if "mastodon" in args.sources:
+                mastodon = load_tool("mastodon-user-search")
+                instances = args.instances
+                if args.file:
+                    instances = mastodon.get_instances_from_file(args.file)
+                session = create_session(pool_size=args.limit)
+                cache = None
+                if not args.no_cache:
+                    cache = mastodon.ResultCache(cache_path('mastodon-results.sqlite'))
+                    cleanup.callback(cache.close)
+                instances_session = create_session(cache=http_cache, ttl=mastodon.INSTANCES_TTL)
+                tasks.append(discovery.mastodon(mastodon, instances, session, cache, instances_session))
+            if "nostr" in args.sources:
+                nostr = load_tool("nostr-user-search")
+                health = nostr.RelayHealth(cache_path('nostr-relay-health.sqlite'))
+                cleanup.callback(health.close)
+                pool = await async_cleanup.enter_async_context(nostr.RelayPool(health=health))
+                tasks.append(discovery.nostr(nostr, health.rank(args.relays or nostr.DEFAULT_RELAYS), pool, args.timeout))
+            if "archives" in args.sources:
+                engine = ProbeEngine(workers=args.limit, cache=http_cache, ttl=ARCHIVE_TTL)
+                tasks.append(discovery.archives(engine))
+
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+    for source, result in zip([s for s in SOURCES if s in args.sources], results):
+        if isinstance(result, Exception):
+            emit(Record(handle, source, source, False, error=str(result) or type(result).__name__))
+
+def print_record(record, verbose=False):
+    if record.found:
+        name = f" ({record.name})" if record.name else ""
+        print(f"[{record.source}] {record.service}: {record.url or 'found'}{name}")
+    elif verbose or record.error and record.service == record.source:
+        print(f"[{record.source}] {record.service}: {record.error or 'not found'}")
+
+def main():
+    description = "Search for a handle on Mastodon, Nostr and tweet archives at the same time."
+    epilog = ("Created by inforensics.ai\n"
+              "Report bugs to jascha@inforensics.ai")
+
+    parser = argparse.ArgumentParser(description=description, epilog=epilog,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("handle", help="The handle to search for; for name@domain, Nostr resolves it as NIP-05 and the other sources use name")
+    parser.add_argument("-s", "--sources", default=",".join(SOURCES),
+                        help=f"Comma-separated sources to search (default: {','.join(SOURCES)})")
+    parser.add_argument("-i", "--instances", nargs='+', help="Mastodon instances to search (default: from the instances.social API)")
+    parser.add_argument("-f", "--file", help="File containing a list of Mastodon instances to search")
+    parser.add_argument("-r", "--relays", nargs='+', help="Nostr relays to search (default: the nostr-user-search list)")
+    parser.add_argument("-l", "--limit", type=int, default=64, help="Maximum lookups in flight across all sources (default: 64)")
+    parser.add_argument("-t", "--timeout", type=float, default=10.0, help="Per-relay Nostr query timeout in seconds (default: 10)")
+    parser.add_argument("-j", "--json", action="store_true", help="Stream results as JSON lines")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the Mastodon result cache")
+    parser.add_argument("--no-http-cache", action="store_true", help="Do not read or write the shared HTTP response cache")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Also show sources where the handle was not found")
+    args = parser.parse_args()
+
+    args.sources = [source.strip() for source in args.sources.split(",") if source.strip()]
+    unknown = set(args.sources) - set(SOURCES)
+    if unknown:
+        parser.error(f"unknown source(s): {', '.join(sorted(unknown))}")
+    handle = args.handle.lstrip("@")
+    log = sys.stderr if args.json else sys.stdout
+
+    print("Username Discovery Script", file=log)
+    print("Created by inforensics.ai", file=log)
+    print(file=log)
+    print(f"Searching for {handle} on {', '.join(args.sources)}...", file=log)
+
+    counts = {}
+
+    def emit(record):
+        counts.setdefault(record.source, [0, 0])
+        counts[record.source][0] += record.found
+        counts[record.source][1] += 1
+        if args.json:
+            print(dumps(record), flush=True)
+        else:
+            print_record(record, args.verbose)
+
+    http_cache = None if args.no_http_cache else shared_cache()
+    started = time.monotonic()
+    try:
+        asyncio.run(discover(handle, args, emit, http_cache))
+    except KeyboardInterrupt:
+        sys.exit("Interrupted")
+    finally:
+        if http_cache:
+            http_cache.close()
+    summary = ", ".join(f"{source}: {found}/{total}" for source, (found, total) in counts.items())
+    print(f"\nFound {sum(found for found, _ in counts.values())} matches ({summary}) in {time.monotonic() - started:.1f}s", file=log)
+
+if __name__ == "__main__":
+    main()